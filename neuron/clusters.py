@@ -0,0 +1,129 @@
+'''
+Union-find tracking of clusters of connected neurons.
+
+Neurons are numbered 0 .. n-1. Every connection event merges the clusters of
+the two neurons, and cluster statistics are kept up to date on each merge, so
+reading them costs nothing per step. The step at which each neuron first
+connected, and to which neuron, is recorded as well: the connectivity curve
+and other first-passage statistics follow from it after the run.
+'''
+import numpy as np
+
+
+########## Classes ##########
+
+
+class Clusters(object):
+    '''Disjoint sets of neurons with running cluster statistics.
+
+    Besides its size, each cluster keeps the range of x and y positions of
+    its neurons' origins. A cluster spans the pattern when that range covers
+    all origins along x or along y.'''
+
+    def __init__(self, xs, ys):
+        '''xs, ys - x and y positions of each neuron's origin.'''
+        n = len(xs)
+        self.parent = list(range(n))
+        self.size = [1] * n
+        # Position ranges per cluster, valid for roots only.
+        self.xmin = list(xs)
+        self.xmax = list(xs)
+        self.ymin = list(ys)
+        self.ymax = list(ys)
+        # Pattern sides.
+        self.left, self.right = min(xs), max(xs)
+        self.bottom, self.top = min(ys), max(ys)
+
+        # Running statistics.
+        self.n = n
+        # Number of clusters, isolated neurons included.
+        self.count = n
+        # Number of neurons in clusters of two or more.
+        self.n_connected = 0
+        self.largest = 1
+        self.spanning_x = False
+        self.spanning_y = False
+
+        # Step of each neuron's first connection and the neuron it connected
+        # to, -1 until connected. Connections are dated with step, which the
+        # engine keeps at its current step.
+        self.first_contact = np.full((n, 2), -1, dtype=np.int32)
+        self.step = 0
+
+    def __len__(self):
+        return self.n
+
+    def find(self, a):
+        '''Return the root of a's cluster, halving the path on the way.'''
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def roots(self):
+        '''Return an array with the root of every neuron's cluster.'''
+        parent = np.array(self.parent)
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                return parent
+            parent = grand
+
+    def connected(self, a, b):
+        '''True if a and b are in the same cluster.'''
+        return self.find(a) == self.find(b)
+
+    def union(self, a, b):
+        '''Merge the clusters of a and b. Return False if already merged.'''
+        ra = self.find(a)
+        rb = self.find(b)
+        if ra == rb:
+            return False
+
+        # Neurons alone until now connect for the first time, to each other.
+        for x, y, root in ((a, b, ra), (b, a, rb)):
+            if self.size[root] == 1:
+                self.n_connected += 1
+                self.first_contact[x] = (self.step, y)
+
+        # Attach the smaller cluster to the larger one.
+        a, b = ra, rb
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.count -= 1
+        self.largest = max(self.largest, self.size[a])
+
+        # Update ranges and spanning.
+        self.xmin[a] = min(self.xmin[a], self.xmin[b])
+        self.xmax[a] = max(self.xmax[a], self.xmax[b])
+        self.ymin[a] = min(self.ymin[a], self.ymin[b])
+        self.ymax[a] = max(self.ymax[a], self.ymax[b])
+        if self.xmin[a] <= self.left and self.xmax[a] >= self.right:
+            self.spanning_x = True
+        if self.ymin[a] <= self.bottom and self.ymax[a] >= self.top:
+            self.spanning_y = True
+        return True
+
+    @property
+    def spanning(self):
+        '''True if a cluster spans the pattern along x or y.'''
+        return self.spanning_x or self.spanning_y
+
+    def fraction(self):
+        '''Fraction of neurons connected to at least one other neuron.'''
+        return float(self.n_connected) / self.n
+
+    def stats(self):
+        '''Return (connected fraction, largest cluster size,
+        number of clusters, spanning).'''
+        return (self.fraction(), self.largest, self.count, self.spanning)
+
+    def connectivity(self, steps):
+        '''Fraction of neurons connected by each step 0 .. steps - 1, from
+        first_contact.'''
+        when = self.first_contact[:, 0]
+        counts = np.bincount(when[when >= 0], minlength=steps)[:steps]
+        return np.cumsum(counts) / float(self.n)
@@ -0,0 +1,923 @@
+'''
+Simulation engines for the lattice growth model.
+
+An engine advances all neurons of a run and exposes the same steps as
+Neuron: born(), grow(), clean(), check_alive(), then check_connections().
+
+- ObjectEngine drives a list of Neuron objects through an Occupancy. It is the
+  reference implementation.
+- ArrayEngine keeps the growing tips of all neurons in flat NumPy arrays, so
+  that growing and finding tips that passed their destination are single
+  array operations (see kernels, compiled with Numba when installed). Only
+  those tips go through the branching logic, one at a time and in the same
+  order as the reference, so that for the same random state both engines
+  give the same run.
+- BatchEngine runs several replicas of an experiment on copies of one
+  lattice in the same arrays, each with its own random generator.
+- EventEngine jumps from event to event: the steps at which tips reach their
+  destination or meet head-on are computed when tips start, and steps
+  without events cost nothing.
+'''
+import heapq
+import random
+from array import array
+from collections import deque
+
+import numpy as np
+
+import kernels
+import settings
+from clusters import Clusters
+from neuron import Directions, Occupancy, draw_edge
+from neuron import ErrorLatticeEdge
+
+
+########## Classes ##########
+
+
+class ObjectEngine(object):
+    '''Reference engine: a list of Neuron objects sharing an Occupancy.'''
+
+    def __init__(self, neurons, local=True):
+        self.neurons = neurons
+        self.local = local
+        self.occupancy = Occupancy(neurons)
+        self.clusters = self.occupancy.clusters
+        # Current step: number of grow() calls.
+        self.t = 0
+
+    def __len__(self):
+        return len(self.neurons)
+
+    def born(self):
+        for neuron in self.neurons:
+            neuron.born()
+
+    def grow(self):
+        self.t += 1
+        for neuron in self.neurons:
+            neuron.grow()
+
+    def clean(self):
+        for neuron in self.neurons:
+            neuron.clean(local=self.local)
+
+    def check_alive(self):
+        for neuron in self.neurons:
+            neuron.check_alive()
+
+    def check_connections(self):
+        self.clusters.step = self.t
+        self.occupancy.check_connections()
+
+    def stats_connections(self):
+        return self.clusters.fraction()
+
+    def growth(self):
+        '''Neuron.growth() summed over the neurons.'''
+        return tuple(sum(x) for x in zip(*[n.growth() for n in self.neurons]))
+
+    def draw(self, draw, colors):
+        for neuron, color in zip(self.neurons, colors):
+            neuron.draw(draw, color)
+
+    def tips(self):
+        '''Boundary paths of all neurons, as in ArrayEngine.tips().'''
+        site = self.neurons[0].lattice.site
+        rows = [(site(p.origin), site(p.dest), i, p.length, p.max_length, p.alive)
+                for i, neuron in enumerate(self.neurons)
+                for p in neuron.boundary_paths]
+        return tip_arrays(list(zip(*rows)) if rows else [[]] * 6)
+
+    def frontier_sites(self):
+        '''(neuron, site) of every origin of boundary paths.'''
+        site = self.neurons[0].lattice.site
+        for i, neuron in enumerate(self.neurons):
+            for node in neuron.frontier:
+                yield i, site(node)
+
+
+class ArrayEngine(object):
+    '''Struct-of-arrays engine.
+
+    Tip i of the run grows from site tip_origin[i] to site tip_dest[i] along
+    direction tip_dir[i], has grown tip_length[i] of tip_max[i], belongs to
+    neuron tip_owner[i] and grows only if tip_alive[i]. Tips are kept in
+    creation order, which is the order of Neuron.boundary_paths.
+
+    Growth observables are kept as running counters, one per replica:
+    growing tips n_live, tips that stopped for good n_dead (completed with
+    nowhere to go, or dead in check_alive()), completed edges n_edges, tips
+    that split in two n_splits, and neurite_length, the length of completed
+    edges and tips. growth() reads them.
+    '''
+
+    # Neuron settings.
+    speed = settings.GROW_SPEED
+    split_prob = settings.SPLIT_PROBABILITY
+    # Copies of the lattice side by side, see BatchEngine.
+    replicas = 1
+    # Keep completed edges, only needed for drawing.
+    keep_edges = True
+
+    def __init__(self, lattice, origins, local=True, rng=random):
+        '''lattice - Lattice the neurons grow on.
+        origins - site number of each neuron's origin.
+        local - consider local structure when choosing where to go.
+        rng - source of random numbers, with the interface of random.'''
+        self.lattice = lattice
+        self.connections = lattice.connections
+        self.local = local
+        self.rng = rng
+        # Current step: number of grow() calls.
+        self.t = 0
+
+        self._degree = lattice.degree
+
+        # Length and local weights per direction.
+        self._table = Directions(self.connections)
+        self._max = self._table.lengths
+
+        # Neurons.
+        self.origins = [int(x) for x in origins]
+        self.n = len(self.origins)
+        # Occupied sites, and occupied or heading-to sites, per neuron.
+        self.nodes = [set([x]) for x in self.origins]
+        self.taken = [set([x]) for x in self.origins]
+        # Per neuron: number of tips from each origin site, and number of
+        # neighbours of that site the neuron does not occupy. (owner, site)
+        # pairs whose count dropped to zero wait for check_alive().
+        self.frontier = [{} for x in self.origins]
+        self.free = [{} for x in self.origins]
+        self._exhausted = []
+        self.connected = np.zeros(self.n, dtype=bool)
+
+        # Ownership of sites.
+        self.size = lattice.size * self.replicas
+        self.owner = np.full(self.size, -1, dtype=np.int32)
+        self.is_shared = np.zeros(self.size, dtype=bool)
+        self.shared = {}
+        self.contacts = []
+        self.clusters = self._make_clusters()
+        for i, site in enumerate(self.origins):
+            self.claim(site, i)
+
+        # Tips.
+        self.n_tips = 0
+        self._allocate(max(16, 8 * self.n))
+
+        # Growth counters, per replica.
+        self.n_live = [0] * self.replicas
+        self.n_dead = [0] * self.replicas
+        self.n_edges = [0] * self.replicas
+        self.n_splits = [0] * self.replicas
+        self.neurite_length = [0.0] * self.replicas
+
+        # Completed edges: origin, destination and owner of each.
+        self.edge_origin = array('i')
+        self.edge_dest = array('i')
+        self.edge_owner = array('i')
+
+    @classmethod
+    def from_neurons(cls, neurons, local=True, rng=random):
+        '''Engine for the origins and lattice of unborn Neurons.'''
+        lattice = neurons[0].lattice
+        origins = [lattice.site(x.origin) for x in neurons]
+        return cls(lattice, origins, local=local, rng=rng)
+
+    def __len__(self):
+        return self.n
+
+    ########## Tips ##########
+
+    def _allocate(self, capacity):
+        '''Resize tip arrays to capacity, keeping the first n_tips tips.'''
+        n = self.n_tips
+        old = getattr(self, 'tip_origin', None)
+        arrays = (
+            ('tip_origin', np.int32), ('tip_dest', np.int32),
+            ('tip_dir', np.int8), ('tip_owner', np.int32),
+            ('tip_length', np.float64), ('tip_max', np.float64),
+            ('tip_alive', bool),
+        )
+        for name, dtype in arrays:
+            new = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                new[:n] = getattr(self, name)[:n]
+            setattr(self, name, new)
+
+    def _add_tip(self, origin, dest, direction, length, owner):
+        '''Append a tip and return its index.'''
+        i = self.n_tips
+        if i == len(self.tip_origin):
+            self._allocate(2 * i)
+        self.tip_origin[i] = origin
+        self.tip_dest[i] = dest
+        self.tip_dir[i] = direction
+        self.tip_owner[i] = owner
+        self.tip_length[i] = length
+        self.tip_max[i] = self._max[direction]
+        self.tip_alive[i] = True
+        self.n_tips = i + 1
+        self._enter_frontier(origin, owner)
+        self._count_tip(length, owner)
+        return i
+
+    def _count_tip(self, length, owner):
+        '''Count a new tip of neuron owner, length long.'''
+        r = self._replica(owner)
+        self.n_live[r] += 1
+        self.neurite_length[r] += length
+
+    def _enter_frontier(self, origin, owner):
+        '''Count a new tip of neuron owner growing from site origin.'''
+        frontier = self.frontier[owner]
+        if origin in frontier:
+            frontier[origin] += 1
+        else:
+            frontier[origin] = 1
+            nodes = self.nodes[owner]
+            # Neighbours outside the window are never occupied.
+            self.free[owner][origin] = self._degree - len(
+                [x for x in self._neighbours(origin) if x in nodes])
+
+    def _drop_tip(self, i):
+        '''Forget completed tip i in the frontier counts.'''
+        owner = int(self.tip_owner[i])
+        origin = int(self.tip_origin[i])
+        self.n_live[self._replica(owner)] -= 1
+        frontier = self.frontier[owner]
+        frontier[origin] -= 1
+        if not frontier[origin]:
+            del frontier[origin]
+            del self.free[owner][origin]
+
+    def _compact(self, keep):
+        '''Keep tips where keep is True, in order.'''
+        n = self.n_tips
+        index = np.flatnonzero(keep[:n])
+        for name in ('tip_origin', 'tip_dest', 'tip_dir', 'tip_owner',
+                     'tip_length', 'tip_max', 'tip_alive'):
+            a = getattr(self, name)
+            a[:len(index)] = a[index]
+        self.n_tips = len(index)
+
+    def _make_clusters(self):
+        '''Cluster tracker of the neurons.'''
+        coors = [self._node(x).coor for x in self.origins]
+        return Clusters([x[0] for x in coors], [x[1] for x in coors])
+
+    def _rng(self, owner):
+        '''Random numbers for neuron owner.'''
+        return self.rng
+
+    def _replica(self, owner):
+        '''Replica of neuron owner.'''
+        return 0
+
+    def _node(self, site):
+        '''Node at site.'''
+        return self.lattice.node(site)
+
+    def _neighbours(self, site):
+        '''Neighbour sites of site inside the lattice window.'''
+        return self.lattice.row(site)[0]
+
+    def _row(self, site):
+        '''(neighbour sites, directions) of site.'''
+        sites, directions = self.lattice.row(site)
+        if len(sites) < self._degree:
+            raise ErrorLatticeEdge(self._node(site))
+        if self.lattice.size > self.size:
+            self._extend()
+        return sites, directions
+
+    def _extend(self):
+        '''Grow site arrays to the size of a ChunkedLattice that gained
+        chunks.'''
+        size = max(self.lattice.size, 2 * self.size)
+        owner = np.full(size, -1, dtype=np.int32)
+        owner[:self.size] = self.owner
+        is_shared = np.zeros(size, dtype=bool)
+        is_shared[:self.size] = self.is_shared
+        self.owner = owner
+        self.is_shared = is_shared
+        self.size = size
+
+    ########## Sites ##########
+
+    def claim(self, site, owner):
+        '''Record that neuron owner occupies site.'''
+        nodes = self.nodes[owner]
+        if site not in nodes:
+            nodes.add(site)
+            free = self.free[owner]
+            for x in self._neighbours(site):
+                if x in free:
+                    free[x] -= 1
+                    if not free[x]:
+                        self._exhausted.append((owner, x))
+        self._occupy(site, owner)
+
+    def _occupy(self, site, owner):
+        '''Record owner in the ownership of site, and the contacts it makes.'''
+        first = self.owner[site]
+        if first < 0 or first == owner:
+            self.owner[site] = owner
+            return
+        owners = self.shared.get(site)
+        if owners is None:
+            owners = self.shared[site] = [int(first)]
+            self.is_shared[site] = True
+        if owner not in owners:
+            self.contacts.append((owners[0], owner))
+            owners.append(owner)
+
+    ########## Steps ##########
+
+    def hands(self, rng=random):
+        '''Number of initial hands for a neuron. Same as Neuron.hands.'''
+        if self._table.random_hands:
+            return rng.randrange(settings.Hands_low, settings.Hands_high + 1, 1)
+        return self.connections
+
+    def born(self):
+        '''Grow hands of every neuron. Same as Neuron.born().'''
+        for i, origin in enumerate(self.origins):
+            rng = self._rng(i)
+            index = rng.sample(range(self.connections), self.hands(rng))
+            index.sort()
+            sites, directions = self._row(origin)
+            for k in index:
+                self.taken[i].add(sites[k])
+                self._add_tip(origin, sites[k], directions[k], 0, i)
+
+    def grow(self):
+        '''Increase length of all alive tips.'''
+        self.t += 1
+        self._count_growth()
+        kernels.grow(self.tip_length, self.tip_alive, self.n_tips, self.speed)
+
+    def _count_growth(self):
+        '''Add a step of growth of every growing tip to the neurite length.'''
+        for r, live in enumerate(self.n_live):
+            self.neurite_length[r] += self.speed * live
+
+    def clean(self):
+        '''Turn tips that passed their destination into completed edges and
+        branch from the destination. Same as Neuron.clean() for each neuron.
+        '''
+        over = kernels.overshoots(self.tip_length, self.tip_max, self.n_tips)
+        if not len(over):
+            return
+        # Neuron by neuron, each in tip creation order.
+        over = over[np.argsort(self.tip_owner[over], kind='stable')]
+        done = self._resolve(over.tolist(), self.tip_owner[over].tolist())
+
+        keep = np.ones(self.n_tips, dtype=bool)
+        keep[done] = False
+        self._compact(keep)
+
+    def _resolve(self, over, owners):
+        '''Branch tips over, sorted by their owners then creation. Return
+        the completed tips.'''
+        done = []
+        start = 0
+        while start < len(over):
+            end = start
+            while end < len(over) and owners[end] == owners[start]:
+                end += 1
+            queue = deque(over[start:end])
+            while queue:
+                i = queue.popleft()
+                done.append(i)
+                for j in self._branch(i):
+                    # New tips already past their destination are handled
+                    # in the same pass, as Neuron.clean() does.
+                    if self._overshoots(j):
+                        queue.append(j)
+            start = end
+        return done
+
+    def _overshoots(self, i):
+        '''True if tip i is past its destination.'''
+        return self.tip_length[i] > self.tip_max[i]
+
+    def _branch(self, i):
+        '''Complete tip i and start new tips from its destination.
+        Return indices of the new tips.'''
+        owner = int(self.tip_owner[i])
+        rng = self._rng(owner)
+        origin = int(self.tip_origin[i])
+        dest = int(self.tip_dest[i])
+        direction = int(self.tip_dir[i])
+        new_length = float(self.tip_length[i] - self.tip_max[i])
+
+        # The edge counts for its own length, new tips for theirs.
+        r = self._replica(owner)
+        self.n_edges[r] += 1
+        self.neurite_length[r] -= new_length
+        if self.keep_edges:
+            self.edge_origin.append(origin)
+            self.edge_dest.append(dest)
+            self.edge_owner.append(owner)
+        self._drop_tip(i)
+        self.claim(dest, owner)
+
+        # Split or not.
+        split = rng.random() < self.split_prob
+
+        # Possible ways to go.
+        taken = self.taken[owner]
+        sites, directions = self._row(dest)
+        ways = [(x, k) for x, k in zip(sites, directions) if x not in taken]
+
+        if len(ways) <= 1:
+            chosen = ways
+        elif self.local:
+            chosen = self._local_sample(ways, direction, 2 if split else 1, rng)
+        else:
+            chosen = rng.sample(ways, 2 if split else 1)
+
+        if len(chosen) == 2:
+            self.n_splits[r] += 1
+        elif not chosen:
+            self.n_dead[r] += 1
+        new = []
+        for site, k in chosen:
+            taken.add(site)
+            new.append(self._add_tip(dest, site, k, new_length, owner))
+        return new
+
+    def _local_sample(self, ways, direction, n, rng):
+        '''Choose n ways weighted by their local structure.
+        Same draws as Neuron.local_sample().'''
+        if not self._table.weighted:
+            return rng.sample(ways, n)
+        if n > len(ways):
+            return []
+        sites = dict((k, x) for x, k in ways)
+        chosen = self._table.sample(direction, sites, n, rng=rng)
+        return [(sites[k], k) for k in chosen]
+
+    def check_alive(self):
+        '''Turn tips whose origin has no free neighbour to dead.
+        Only origins that ran out of free neighbours since the last call
+        are looked up.'''
+        if not self._exhausted:
+            return
+        size = self.size
+        keys = [owner * size + site for owner, site in self._exhausted]
+        self._exhausted = []
+        n = self.n_tips
+        tips = self.tip_owner[:n].astype(np.int64) * size + self.tip_origin[:n]
+        dead = np.flatnonzero(np.isin(tips, keys) & self.tip_alive[:n])
+        self.tip_alive[dead] = False
+        for owner in self.tip_owner[dead].tolist():
+            self._count_dead(owner)
+
+    def _count_dead(self, owner):
+        '''Count a tip of neuron owner that stopped growing.'''
+        r = self._replica(owner)
+        self.n_live[r] -= 1
+        self.n_dead[r] += 1
+
+    ########## Connections ##########
+
+    def check_connections(self):
+        '''Connect neurons sharing a site or meeting head-on on an edge.
+        Same result as Occupancy.check_connections().'''
+        self._date()
+        for a, b in self.contacts:
+            self.connect(a, b)
+        del self.contacts[:]
+
+        i, j = kernels.head_on(
+            self.tip_origin, self.tip_dest, self.tip_owner, self.tip_length,
+            self.tip_max, self.n_tips, self.owner, self.is_shared, self.size)
+        if not len(i):
+            return
+
+        # Pairs from different clusters.
+        roots = self._roots()
+        p = self.tip_owner[i]
+        q = self.tip_owner[j]
+        meet = roots[p] != roots[q]
+        for a, b in zip(p[meet].tolist(), q[meet].tolist()):
+            self.connect(a, b)
+
+    def _date(self):
+        '''Date the connections made from now on with the current step.'''
+        self.clusters.step = self.t
+
+    def _roots(self):
+        '''Root of the cluster of every neuron.'''
+        return self.clusters.roots()
+
+    def connect(self, a, b):
+        '''Connect neurons a and b.'''
+        self.connected[a] = True
+        self.connected[b] = True
+        self.clusters.union(a, b)
+
+    def stats_connections(self):
+        return self.clusters.fraction()
+
+    def growth(self):
+        '''Return (growing tips, dead tips, neurite length, completed edges,
+        splits).'''
+        return (self.n_live[0], self.n_dead[0], self.neurite_length[0],
+                self.n_edges[0], self.n_splits[0])
+
+    ########## Drawing ##########
+
+    def draw(self, draw, colors):
+        '''Draw origins, completed edges and tips of all neurons.
+        Neurons whose color is None are left out.'''
+        node = self._node
+        for origin, color in zip(self.origins, colors):
+            if color is None:
+                continue
+            coor = node(origin).coor
+            draw.ellipse([(coor[0] - 5, coor[1] - 5), (coor[0] + 10, coor[1] + 10)], fill=color)
+        for a, b, owner in zip(self.edge_origin, self.edge_dest, self.edge_owner):
+            if colors[owner] is not None:
+                draw_edge(draw, node(a), node(b), colors[owner], lattice=self.lattice)
+        for i, length in self._tip_lengths():
+            color = colors[self.tip_owner[i]]
+            if color is None:
+                continue
+            draw_edge(draw, node(self.tip_origin[i]), node(self.tip_dest[i]), color,
+                      length / self.tip_max[i], self.lattice)
+
+    def _tip_lengths(self):
+        '''(index, length) of every tip.'''
+        return zip(range(self.n_tips), self.tip_length[:self.n_tips].tolist())
+
+    ########## Views ##########
+
+    def tips(self):
+        '''Read-only arrays over the tips: origin and dest sites, owner,
+        length, maximum and alive. Views of the tip arrays, valid until the
+        next step.'''
+        n = self.n_tips
+        return tip_arrays([x[:n] for x in (
+            self.tip_origin, self.tip_dest, self.tip_owner, self.tip_length,
+            self.tip_max, self.tip_alive)])
+
+    def frontier_sites(self):
+        '''(neuron, site) of every site tips grow from.'''
+        for owner, sites in enumerate(self.frontier):
+            for site in sites:
+                yield owner, site
+
+
+class BatchEngine(ArrayEngine):
+    '''Several runs on copies of one lattice, advanced together.
+
+    Replica r owns sites r*size .. (r+1)*size - 1 of the site arrays, size
+    being the number of sites of the lattice, and neurons first[r] ..
+    first[r+1] - 1. Growing, finding tips past their destination and
+    matching head-on tips are then single array operations over all
+    replicas. Each replica draws from its own random generator and has its
+    own Clusters in clusters[r], so that it goes through the same run as an
+    ArrayEngine with its origins and generator.
+    '''
+
+    def __init__(self, lattice, origins, local=True, rngs=None):
+        '''lattice - Lattice every replica grows on.
+        origins - site numbers of the neurons' origins, one list per replica.
+        local - consider local structure when choosing where to go.
+        rngs - random generators, one per replica. Seeded from random if
+        None.'''
+        if rngs is None:
+            rngs = [random.Random(random.getrandbits(64)) for x in origins]
+        if len(rngs) != len(origins):
+            raise ValueError('One random generator per replica is needed.')
+        self.replicas = len(origins)
+        self.rngs = list(rngs)
+        self.first = [0]
+        self.replica_of = []
+        for r, sites in enumerate(origins):
+            self.first.append(self.first[-1] + len(sites))
+            self.replica_of.extend([r] * len(sites))
+        flat = [x + r * lattice.size for r, sites in enumerate(origins) for x in sites]
+        super(BatchEngine, self).__init__(lattice, flat, local=local, rng=None)
+
+    @classmethod
+    def from_neurons(cls, runs, local=True, rngs=None):
+        '''Engine for the origins of unborn Neurons, one list per replica,
+        on the lattice of the first one.'''
+        lattice = runs[0][0].lattice
+        origins = [[lattice.site(x.origin) for x in neurons] for neurons in runs]
+        return cls(lattice, origins, local=local, rngs=rngs)
+
+    def _make_clusters(self):
+        clusters = []
+        for r in range(self.replicas):
+            coors = [self._node(x).coor
+                     for x in self.origins[self.first[r]:self.first[r + 1]]]
+            clusters.append(Clusters([x[0] for x in coors], [x[1] for x in coors]))
+        return clusters
+
+    def _rng(self, owner):
+        return self.rngs[self.replica_of[owner]]
+
+    def _replica(self, owner):
+        return self.replica_of[owner]
+
+    def _node(self, site):
+        return self.lattice.node(site % self.lattice.size)
+
+    def _neighbours(self, site):
+        r, site = divmod(site, self.lattice.size)
+        base = r * self.lattice.size
+        return [x + base for x in self.lattice.row(site)[0]]
+
+    def _row(self, site):
+        r, local = divmod(site, self.lattice.size)
+        sites, directions = self.lattice.row(local)
+        if len(sites) < self._degree:
+            raise ErrorLatticeEdge(self._node(site))
+        base = r * self.lattice.size
+        return [x + base for x in sites], directions
+
+    ########## Connections ##########
+
+    def _date(self):
+        for c in self.clusters:
+            c.step = self.t
+
+    def _roots(self):
+        return np.concatenate([c.roots() + first
+                               for c, first in zip(self.clusters, self.first)])
+
+    def connect(self, a, b):
+        '''Connect neurons a and b, of the same replica.'''
+        self.connected[a] = True
+        self.connected[b] = True
+        first = self.first[self.replica_of[a]]
+        self.clusters[self.replica_of[a]].union(a - first, b - first)
+
+    def stats_connections(self):
+        '''Fraction of connected neurons, per replica.'''
+        return [c.fraction() for c in self.clusters]
+
+    def stats(self):
+        '''Clusters.stats() per replica.'''
+        return [c.stats() for c in self.clusters]
+
+    def growth(self):
+        '''ArrayEngine.growth() per replica.'''
+        return list(zip(self.n_live, self.n_dead, self.neurite_length,
+                        self.n_edges, self.n_splits))
+
+    ########## Views ##########
+
+    def tips(self, replica=None):
+        '''ArrayEngine.tips(), of one replica in its own site and neuron
+        numbers if replica is given.'''
+        tips = super(BatchEngine, self).tips()
+        if replica is None:
+            return tips
+        first = self.first[replica]
+        owner = tips['owner']
+        index = np.flatnonzero((owner >= first) & (owner < self.first[replica + 1]))
+        base = replica * self.lattice.size
+        return tip_arrays([
+            tips['origin'][index] - base, tips['dest'][index] - base,
+            owner[index] - first, tips['length'][index],
+            tips['maximum'][index], tips['alive'][index]])
+
+    def frontier_sites(self, replica=None):
+        '''ArrayEngine.frontier_sites(), of one replica in its own site and
+        neuron numbers if replica is given.'''
+        if replica is None:
+            for x in super(BatchEngine, self).frontier_sites():
+                yield x
+            return
+        first = self.first[replica]
+        base = replica * self.lattice.size
+        for owner in range(first, self.first[replica + 1]):
+            for site in self.frontier[owner]:
+                yield owner - first, site - base
+
+    ########## Drawing ##########
+
+    def draw(self, draw, colors, replica=0):
+        '''Draw the neurons of one replica, colors holding one color per
+        neuron of the replica.'''
+        full = [None] * self.n
+        full[self.first[replica]:self.first[replica + 1]] = colors
+        super(BatchEngine, self).draw(draw, full)
+
+
+class EventEngine(ArrayEngine):
+    '''Event-driven engine.
+
+    Tips grow at the same speed and edges have fixed lengths, so the step at
+    which a tip passes its destination is known when the tip starts, and so
+    is the step at which two tips meeting head-on touch. Both are kept in
+    priority queues and grow() only advances the clock: a step without
+    events costs nothing, whatever the number of tips.
+
+    Lengths are added up step by step as in ArrayEngine, so both engines
+    give the same run for the same random state, but only once for all the
+    tips starting with the same length: tip_sums[i] is the shared list of
+    lengths of tip i at each step since tip_step[i], up to tip_final[i] at
+    step tip_arrival[i] when it passes its destination. A tip's length is
+    read from it while the tip grows, and stays tip_length[i] once it
+    stops. Tips are never removed,
+    completed ones are flagged in tip_done, and with no array operations
+    over them they are kept in lists. The tips not done yet are indexed
+    apart, so a step only looks at those.
+    '''
+
+    def __init__(self, lattice, origins, local=True, rng=random):
+        # (step, owner, tip) arrivals and (step, tip, tip) head-on meetings.
+        self._arrivals = []
+        self._meetings = []
+        # (origin, dest) -> tips growing from origin to dest.
+        self._heading = {}
+        # Tips not done, in creation order, and by (owner, origin).
+        self._active = {}
+        self._rooted = {}
+        super(EventEngine, self).__init__(lattice, origins, local=local, rng=rng)
+
+    def _allocate(self, capacity):
+        '''Start empty tip lists.'''
+        for name in ('tip_origin', 'tip_dest', 'tip_dir', 'tip_owner',
+                     'tip_length', 'tip_max', 'tip_alive', 'tip_step',
+                     'tip_sums', 'tip_arrival', 'tip_final', 'tip_done'):
+            setattr(self, name, [])
+        # (length, maximum) -> lengths step by step from length until past
+        # maximum.
+        self._sums = {}
+
+    def _add_tip(self, origin, dest, direction, length, owner):
+        '''Append a tip, queue its arrival and meetings, return its index.'''
+        i = self.n_tips
+        self.n_tips = i + 1
+        length = float(length)
+        m = self._max[direction]
+        self.tip_origin.append(origin)
+        self.tip_dest.append(dest)
+        self.tip_dir.append(direction)
+        self.tip_owner.append(owner)
+        self.tip_length.append(length)
+        self.tip_max.append(m)
+        self.tip_alive.append(True)
+        self.tip_step.append(self.t)
+        self.tip_done.append(False)
+        self._enter_frontier(origin, owner)
+        self._count_tip(length, owner)
+
+        sums = self._lengths(length, m)
+        step = self.t + len(sums) - 1
+        self.tip_sums.append(sums)
+        self.tip_arrival.append(step)
+        self.tip_final.append(sums[-1])
+        if step > self.t:
+            heapq.heappush(self._arrivals, (step, owner, i))
+
+        # Tips of other neurons coming the other way.
+        for j in self._heading.get((dest, origin), ()):
+            if self.tip_owner[j] != owner:
+                self._schedule_meeting(i, j, self.t)
+        self._heading.setdefault((origin, dest), []).append(i)
+        self._active[i] = None
+        self._rooted.setdefault((owner, origin), []).append(i)
+        return i
+
+    def _drop_tip(self, i):
+        super(EventEngine, self)._drop_tip(i)
+        self.tip_done[i] = True
+        self._heading[(self.tip_origin[i], self.tip_dest[i])].remove(i)
+        del self._active[i]
+        key = (self.tip_owner[i], self.tip_origin[i])
+        self._rooted[key].remove(i)
+        if not self._rooted[key]:
+            del self._rooted[key]
+
+    def _lengths(self, length, m):
+        '''Lengths step by step of a tip starting with length, until past
+        m, added up as grow() does.'''
+        key = (length, m)
+        sums = self._sums.get(key)
+        if sums is None:
+            sums = self._sums[key] = [length]
+            speed = self.speed
+            while length <= m:
+                length += speed
+                sums.append(length)
+        return sums
+
+    def _length(self, i, step):
+        '''Length of tip i at step, at most its arrival step.'''
+        if self.tip_alive[i]:
+            return self.tip_sums[i][step - self.tip_step[i]]
+        return self.tip_length[i]
+
+    def _schedule_meeting(self, i, j, step):
+        '''Queue the first step from step on at which tips i and j, on the
+        same edge in opposite directions, touch while both still grow.'''
+        # Lengths never shrink: bisect the steps before the first arrival.
+        m = self.tip_max[i]
+        end = min(self.tip_arrival[i], self.tip_arrival[j])
+        lo, hi = step, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._length(i, mid) + self._length(j, mid) >= m:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo < end:
+            heapq.heappush(self._meetings, (lo, i, j))
+
+    def _overshoots(self, i):
+        return self.tip_arrival[i] == self.t
+
+    ########## Steps ##########
+
+    def grow(self):
+        '''Advance the clock by one step.'''
+        self.t += 1
+        self._count_growth()
+
+    def clean(self):
+        '''Complete the tips arriving at this step.'''
+        over = []
+        owners = []
+        arrivals = self._arrivals
+        while arrivals and arrivals[0][0] <= self.t:
+            step, owner, i = heapq.heappop(arrivals)
+            if self.tip_alive[i] and not self.tip_done[i]:
+                self.tip_length[i] = self.tip_final[i]
+                over.append(i)
+                owners.append(owner)
+        # Arrivals come out sorted by owner, then tip creation.
+        if over:
+            self._resolve(over, owners)
+
+    def check_alive(self):
+        '''Turn tips whose origin has no free neighbour to dead.'''
+        if not self._exhausted:
+            return
+        exhausted = set(self._exhausted)
+        self._exhausted = []
+        for key in exhausted:
+            for i in self._rooted.get(key, ()):
+                if not self.tip_alive[i]:
+                    continue
+                self.tip_length[i] = self._length(i, self.t)
+                self.tip_step[i] = self.t
+                self.tip_alive[i] = False
+                self._count_dead(self.tip_owner[i])
+
+    def check_connections(self):
+        '''Connect neurons sharing a site or meeting head-on on an edge.'''
+        self._date()
+        for a, b in self.contacts:
+            self.connect(a, b)
+        del self.contacts[:]
+
+        meetings = self._meetings
+        while meetings and meetings[0][0] <= self.t:
+            step, i, j = heapq.heappop(meetings)
+            if self.tip_done[i] or self.tip_done[j]:
+                continue
+            if self._length(i, self.t) + self._length(j, self.t) >= self.tip_max[i]:
+                self.connect(self.tip_owner[i], self.tip_owner[j])
+            else:
+                # A tip died on the way, look again from the next step on.
+                self._schedule_meeting(i, j, self.t + 1)
+
+    def _tip_lengths(self):
+        return [(i, self._length(i, self.t)) for i in self._active]
+
+    def tips(self):
+        '''ArrayEngine.tips(), built from the tip lists.'''
+        index = list(self._active)
+        return tip_arrays([
+            [x[i] for i in index] for x in (self.tip_origin, self.tip_dest,
+                                           self.tip_owner)] + [
+            [self._length(i, self.t) for i in index],
+            [self.tip_max[i] for i in index],
+            [self.tip_alive[i] for i in index]])
+
+
+########## Functions ##########
+
+
+def tip_arrays(columns):
+    '''Tips as a dict of read-only arrays, from columns origin, dest, owner,
+    length, maximum and alive. Arrays are not copied.'''
+    tips = {}
+    for (name, dtype), column in zip(
+            (('origin', np.int32), ('dest', np.int32), ('owner', np.int32),
+             ('length', np.float64), ('maximum', np.float64), ('alive', bool)),
+            columns):
+        view = np.asarray(column, dtype=dtype).view()
+        view.flags.writeable = False
+        tips[name] = view
+    return tips
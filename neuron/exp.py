@@ -1,17 +1,70 @@
-import random
-import math
 import argparse
 import sys
 
-from PIL import Image, ImageDraw
-
-from neuron import Node, Path, Neuron
-from neuron import coor_equal, check_connections, stats_connections
-from neuron import pattern42, pattern6
+from neuron import Exp
 
 # import settings
 
 
+def write_data(out_file_name, data):
+    """Write percentage of connected neurons per timestep, one column per
+    run."""
+    with open(out_file_name, 'w') as data_file:
+        time_series = sorted(data.keys())
+        for t in time_series:
+            data_file.write('{tt} '.format(tt=t))
+            for p in data[t]:
+                data_file.write('{pp:.3f} '.format(pp=p))
+            data_file.write('\n')
+
+
+def write_clusters(clusters_file_name, clusters_data):
+    """Write cluster statistics, one row per run and timestep."""
+    with open(clusters_file_name, 'w') as clusters_file:
+        clusters_file.write('# run t fraction largest clusters spanning\n')
+        for row in clusters_data:
+            clusters_file.write('{0} {1} {2:.3f} {3} {4} {5:d}\n'.format(*row))
+
+
+def write_growth(growth_file_name, growth_data):
+    """Write growth observables, one row per run and timestep."""
+    with open(growth_file_name, 'w') as growth_file:
+        growth_file.write('# run t live dead length edges splits\n')
+        for row in growth_data:
+            growth_file.write('{0} {1} {2:.0f} {3:.0f} {4:.3f} {5:.0f} {6:.0f}\n'.format(*row))
+
+
+def write_contacts(contacts_file_name, contacts_data):
+    """Write the first contact of each neuron, one row per run and neuron:
+    step and partner, -1 if never connected."""
+    with open(contacts_file_name, 'w') as contacts_file:
+        contacts_file.write('# run neuron step partner\n')
+        for r, first_contact in enumerate(contacts_data):
+            for i, (step, partner) in enumerate(first_contact.tolist()):
+                contacts_file.write('{0} {1} {2} {3}\n'.format(r, i, step, partner))
+
+
+def connectivity_data(fraction):
+    """Columns of write_data() from Exp results: the connected fraction of
+    each run, one step late as main() always wrote it."""
+    data = {}
+    previous = [0] * len(fraction)
+    for t, column in enumerate(fraction.T.tolist()):
+        data[t] = previous
+        previous = column
+    return data
+
+
+def run_rows(results, *names):
+    """Rows (run, t, ...) of results names, by run then step."""
+    columns = [results[x].tolist() for x in names]
+    rows = []
+    for r in range(len(columns[0])):
+        for t in range(len(columns[0][r])):
+            rows.append((r, t) + tuple(c[r][t] for c in columns))
+    return rows
+
+
 def main(argv):
 
     # Parser
@@ -24,6 +77,18 @@ def main(argv):
     parser.add_argument('--no-draw', dest='draw', action='store_false')
     parser.add_argument('-s', '--settings', type=str,
         default=None)
+    # Simulation engine.
+    parser.add_argument('-e', '--engine',
+        choices=Exp.engines,
+        default='objects')
+    # Tiles along each lattice index, one process each, for --engine tiles.
+    parser.add_argument('--tiles', type=int, nargs=2, default=None)
+    # Grow on an unbounded ChunkedLattice instead of a window around the grid.
+    parser.add_argument('--chunked', action='store_true')
+    # Grow on a periodic lattice spanning the grid.
+    parser.add_argument('--periodic', action='store_true')
+    # Seed patterns and colors, and draw growth from a BlockRandom stream.
+    parser.add_argument('--seed', type=int, default=None)
     parser.set_defaults(draw=True)
 
     args = parser.parse_args(argv[1:])
@@ -47,98 +112,29 @@ def main(argv):
     # Draw neuron or not.
     draw_flag = args.draw
 
-    # Number of different runs.
-    N_run = settings.N_run
-    # Number of timesteps
-    T = settings.T
-
     # Data file
     out_file_name = '{d}/{n}'.format(d=directory, n=settings.OUT_NAME)
-
-    nx = settings.Nx
-    ny = settings.Ny
-
-    data = {}
-    for r in range(N_run):
-        # Set up neurons.
-        print("Generating patterns...")
-
-        if N != 6:
-            neurons = pattern42(N, nx, ny, p=settings.pn)
-        else:
-            neurons = pattern6(nx, ny, p=settings.pn)
-
-        print("Patterns generated.")
-
-        print("Initiating neurons...")
-
-        for item in neurons:
-            item.born()
-
-        print("Neurons initiated.")
-
-        # Reset timestep and percentage.
-        t = 0
-        percentage = 0
-        connected = []
-
-        # Assign color
-        if draw_flag:
-            for neuron in neurons:
-                neuron.color = tuple([random.randint(0, 255) for i in range(3)] + [100])
-
-        # Run for T steps.
-        while t<=T:
-            print("Timestep: {0}/{1}".format(t, T))
-            # Grow and clean for each neuron.
-            for i,item in enumerate(neurons):
-                # print("Growing {i}th neuron...".format(i=i))
-                item.grow()
-                # print("Cleaning {i}th neuron...".format(i=i))
-                item.clean(local=settings.Local)
-
-            # Record connected neurons.
-            connected = [x for x in neurons if x.connected]
-
-            # Reset image.
-            if draw_flag:
-                img_name = "{d}/trj_{nn}_{rr}_{tt}.png".format(d=directory, nn=N, rr=r, tt=t)
-                img = Image.new('RGBA', (settings.Lx, settings.Ly), 'white')
-                draw = ImageDraw.Draw(img)
-
-                # Draw
-                for neuron in neurons:
-                    neuron.draw(draw, neuron.color)
-                img.save(img_name, 'PNG')
-
-            # Check connections
-            print("Checking connections...")
-            check_connections(neurons, connected)
-            print("Connections checked.")
-
-            # Percentage for previous step.
-            print r, t, percentage
-            if t not in data.keys():
-                data[t] = [percentage]
-            else:
-                data[t].append(percentage)
-
-            # Stats connections after updated.
-            percentage = stats_connections(neurons)
-
-            # Increase timestep
-            t += 1
-
-        # Write data
-        # Update data file after each run.
-        with open(out_file_name, 'w') as data_file:
-            time_series = sorted(data.keys())
-            for t in time_series:
-                data_file.write('{tt} '.format(tt=t))
-                for p in data[t]:
-                    data_file.write('{pp:.3f} '.format(pp=p))
-                data_file.write('\n')
-
+    # Cluster statistics file.
+    clusters_file_name = '{d}/clusters_{n}'.format(d=directory, n=settings.OUT_NAME)
+    # Growth observables file, for the lattice engines.
+    growth_file_name = '{d}/growth_{n}'.format(d=directory, n=settings.OUT_NAME)
+    # First contacts file.
+    contacts_file_name = '{d}/contacts_{n}'.format(d=directory, n=settings.OUT_NAME)
+
+    try:
+        exp = Exp(N, settings, seed=args.seed, engine=args.engine,
+                  periodic=args.periodic, chunked=args.chunked, tiles=args.tiles,
+                  directory=directory if draw_flag else None, verbose=True)
+    except ValueError as e:
+        parser.error(str(e))
+    results = exp.run()
+
+    write_data(out_file_name, connectivity_data(results['fraction']))
+    write_clusters(clusters_file_name, run_rows(
+        results, 'fraction', 'largest', 'count', 'spanning'))
+    write_growth(growth_file_name, [
+        (r, t) + tuple(g) for r, t, g in run_rows(results, 'growth')])
+    write_contacts(contacts_file_name, results['first_contact'])
 
 
 if __name__ == '__main__':
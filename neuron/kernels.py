@@ -0,0 +1,137 @@
+'''
+Array kernels of ArrayEngine.
+
+Every kernel comes in two versions giving the same results bit for bit:
+a NumPy version, and a loop version that Numba compiles into a single pass
+over the arrays. The loop versions are used when Numba is installed, the
+NumPy versions otherwise. BACKEND tells which.
+
+Kernels are deterministic: random draws stay in ArrayEngine, so the backend
+does not change a run for a given seed.
+'''
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+########## Functions ##########
+
+
+def grow_numpy(length, alive, n, speed):
+    '''Add speed to length[i] for alive tips among the first n.'''
+    length[:n][alive[:n]] += speed
+
+
+def grow_loop(length, alive, n, speed):
+    for i in range(n):
+        if alive[i]:
+            length[i] += speed
+
+
+def overshoots_numpy(length, maximum, n):
+    '''Indices of the tips among the first n that passed their maximum.'''
+    return np.flatnonzero(length[:n] > maximum[:n])
+
+
+def overshoots_loop(length, maximum, n):
+    count = 0
+    for i in range(n):
+        if length[i] > maximum[i]:
+            count += 1
+    over = np.empty(count, dtype=np.int64)
+    k = 0
+    for i in range(n):
+        if length[i] > maximum[i]:
+            over[k] = i
+            k += 1
+    return over
+
+
+def head_on_numpy(origin, dest, owner, length, maximum, n, first, is_shared,
+                  size):
+    '''Tips (i, j) meeting head-on among the first n: tip i from a to b and
+    tip j from b to a, owned by different neurons or heading to a shared
+    site, with lengths adding up to the edge. first and is_shared are the
+    owner and shared flag of each site and size the number of sites.'''
+    # Tips heading to a site occupied by another neuron. Both tips of a
+    # head-on pair are among them.
+    origin = origin[:n]
+    dest = dest[:n]
+    first = first[dest]
+    candidates = np.flatnonzero(
+        (first >= 0) & ((first != owner[:n]) | is_shared[dest]))
+    if len(candidates) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Match each candidate a -> b with the candidates b -> a.
+    size = np.int64(size)
+    keys = origin[candidates] * size + dest[candidates]
+    order = np.argsort(keys, kind='mergesort')
+    reverse = dest[candidates] * size + origin[candidates]
+    lo = np.searchsorted(keys[order], reverse, side='left')
+    counts = np.searchsorted(keys[order], reverse, side='right') - lo
+    total = counts.sum()
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    i = np.repeat(candidates, counts)
+    j = candidates[order[starts + np.arange(total)]]
+
+    meet = length[i] + length[j] >= maximum[i]
+    return i[meet], j[meet]
+
+
+def head_on_loop(origin, dest, owner, length, maximum, n, first, is_shared,
+                 size):
+    candidates = np.empty(n, dtype=np.int64)
+    m = 0
+    for i in range(n):
+        f = first[dest[i]]
+        if f >= 0 and (f != owner[i] or is_shared[dest[i]]):
+            candidates[m] = i
+            m += 1
+    if m < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    keys = np.empty(m, dtype=np.int64)
+    for k in range(m):
+        keys[k] = np.int64(origin[candidates[k]]) * size + dest[candidates[k]]
+    order = np.argsort(keys, kind='mergesort')
+    ordered = keys[order]
+
+    # Count the pairs, then fill them in, in the order of head_on_numpy().
+    tips_i = np.empty(0, dtype=np.int64)
+    tips_j = np.empty(0, dtype=np.int64)
+    for fill in range(2):
+        total = 0
+        for k in range(m):
+            i = candidates[k]
+            reverse = np.int64(dest[i]) * size + origin[i]
+            h = np.searchsorted(ordered, reverse)
+            while h < m and ordered[h] == reverse:
+                j = candidates[order[h]]
+                if length[i] + length[j] >= maximum[i]:
+                    if fill:
+                        tips_i[total] = i
+                        tips_j[total] = j
+                    total += 1
+                h += 1
+        if not fill:
+            tips_i = np.empty(total, dtype=np.int64)
+            tips_j = np.empty(total, dtype=np.int64)
+    return tips_i, tips_j
+
+
+if numba is not None:
+    BACKEND = 'numba'
+    grow = numba.njit(cache=True)(grow_loop)
+    overshoots = numba.njit(cache=True)(overshoots_loop)
+    head_on = numba.njit(cache=True)(head_on_loop)
+else:
+    BACKEND = 'numpy'
+    grow = grow_numpy
+    overshoots = overshoots_numpy
+    head_on = head_on_numpy
@@ -1,97 +1,567 @@
 import math
 import random
-import copy
+import weakref
+from array import array
+from bisect import bisect_right
+from collections import deque
+from collections.abc import MutableSequence
 from itertools import combinations, product
+from timeit import default_timer as timer
 
 from PIL import Image, ImageDraw
 import numpy as np
 
 import settings
+from clusters import Clusters
+from streams import BlockRandom
 
 
 ################################
 ############ Classes ###########
 ################################
 
-class Node():
+class LatticeType(object):
+    """Description of one lattice type, from which Directions builds its
+    tables.
+
+    Sites are indexed by integer pairs (i, j). A lattice may have several
+    sublattices of sites with different neighbours: index (i, j) is on
+    sublattice (a*i + b*j) % m for sublattice = (a, b, m).
+    steps - neighbour offsets in index space, one tuple per sublattice.
+    Order matters: it is the order in which Node.neighbours lists
+    neighbours.
+    basis - coordinates of unit steps along i and along j, and shifts the
+    coordinates of each sublattice, in units of UNIT_PATH_LENGTH.
+    turns - setting weighting each turn in local sampling, keyed by the
+    angle in degrees between the arriving and leaving directions. None for
+    no local structure: ways are then chosen uniformly.
+    random_hands - draw the number of initial hands from Hands_low to
+    Hands_high, instead of one per neighbour.
+    """
+
+    def __init__(self, steps, sublattice=(0, 0, 1), basis=((1, 0), (0, 1)),
+                 shifts=((0, 0),), turns=None, random_hands=False):
+        self.steps = steps
+        self.sublattice = sublattice
+        self.basis = basis
+        self.shifts = shifts
+        self.turns = turns
+        self.random_hands = random_hands
+
+
+LATTICE_TYPES = {
+    # Neighbours along x direction.
+    2: LatticeType(steps=(((1, 0), (-1, 0)),)),
+    # Honeycomb, as a brick wall: neighbours along i, and one along j whose
+    # side alternates between the two sublattices. Index (i, j) sits at
+    # (i*sqrt(3)/2, 3j/2), raised by 1/2 on the odd sublattice. Every turn
+    # is 60 degrees.
+    3: LatticeType(steps=(((1, 0), (-1, 0), (0, -1)),
+                          ((1, 0), (-1, 0), (0, 1))),
+                   sublattice=(1, 1, 2),
+                   basis=((math.sqrt(3) / 2, 0), (0, 1.5)),
+                   shifts=((0, 0), (0, 0.5)),
+                   turns={60: 'P3_2', 180: 'P3_1'}),
+    # Neighbours along x and y directions.
+    4: LatticeType(steps=(((1, 0), (-1, 0), (0, 1), (0, -1)),),
+                   turns={0: 'P4_2', 90: 'P4_1', 180: 'P4_2'}),
+    # Neighbours along 6 directions of a triangular lattice. Index (i, j) sits
+    # at (i + j/2, j*sqrt(3)/2).
+    6: LatticeType(steps=(((1, 0), (-1, 0), (0, -1), (1, -1), (-1, 1), (0, 1)),),
+                   basis=((1, 0), (0.5, math.sqrt(3) / 2)),
+                   turns={0: 'P6_3', 60: 'P6_2', 120: 'P6_1', 180: 'P6_1'},
+                   random_hands=True),
+    # Neighbours along x, y, x-y, and x+y. 45 degree turns have always
+    # weighed as going straight, P8_3 is not used.
+    8: LatticeType(steps=(((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1),
+                           (0, -1), (1, -1)),),
+                   turns={0: 'P8_4', 45: 'P8_4', 90: 'P8_2', 135: 'P8_1', 180: 'P8_1'},
+                   random_hands=True),
+}
+
+# Neighbour offsets of the lattice types with a single sublattice.
+NEIGHBOUR_OFFSETS = dict((n, x.steps[0]) for n, x in LATTICE_TYPES.items()
+                         if len(x.steps) == 1)
+
+
+class Node(object):
+    """A lattice site.
+
+    Nodes are addressed by integer lattice indices and interned: there is
+    exactly one Node per (index, connections), so nodes compare and hash by
+    identity-cheap integer keys. Interning holds nodes weakly, so the nodes
+    of a run go away with its neurons and lattice. Float coordinates are
+    only computed on demand for drawing.
+    """
+
+    __slots__ = ('index', 'connections', '_hash', '__weakref__')
+
+    # Interned nodes in use, keyed by (i, j, connections).
+    _interned = weakref.WeakValueDictionary()
 
-    def __init__(self, coordinates, connections):
-        """Init instance.
-        coordinates is a (x, y) tuple with x and y of number type.
+    def __new__(cls, index, connections):
+        """Return the node at index.
+        index is a (i, j) tuple of integer lattice indices.
         connections is a integer number. It can be 2, 3, 4, 6, or 8.
-        max_len is the max_length of path
         """
-        self.coor = tuple([float(x) for x in coordinates])
-        self.connections = int(connections)
+        i, j = index
+        key = (int(i), int(j), int(connections))
+        node = cls._interned.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            node.index = key[:2]
+            node.connections = key[2]
+            node._hash = hash(key)
+            cls._interned[key] = node
+        return node
 
     def __eq__(self, other):
-        """Operatir overloading - comparison equal
-        Need to rewrite for 3 connections.
-        """
+        """Operatir overloading - comparison equal"""
         if isinstance(other, Node):
-            return other.__hash__() == self.__hash__()
+            return self is other or (
+                self.index == other.index and
+                self.connections == other.connections)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
 
     def __hash__(self):
         """Operator overloading - hash method
         Used for set and comparison.
         """
-        return (hash(self.coor) ^ hash(self.connections))
+        return self._hash
 
     def __repr__(self):
         return "Node: at ({c[0]}, {c[1]}) with {n} connections".format(
-        c=self.coor, n=self.connections
+        c=self.index, n=self.connections
         )
 
+    def __copy__(self):
+        # Nodes are interned, a copy is the node itself.
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # Unpickle through __new__ to keep nodes interned.
+        return (Node, (self.index, self.connections))
+
+    @property
+    def coor(self):
+        """Return (x, y) float coordinates of this node, for drawing."""
+        return Directions(self.connections).coor(self.index)
+
     @property
     def neighbours(self):
-        """Return coordinates of neighbours.
+        """Return neighbour nodes.
         Based on number of connections, i.e. type of pattern.
         """
-        neighbours = []
-        length = settings.UNIT_PATH_LENGTH
-        x, y = self.coor
-
-        if self.connections == 2:
-            # Neighbours along x direction.
-            neighbours.append((x + 1*length, y))
-            neighbours.append((x - 1*length, y))
-        elif self.connections == 4:
-            # Neighbours along x and y directions.
-            neighbours.append((x + 1*length, y))
-            neighbours.append((x - 1*length, y))
-            neighbours.append((x, y + 1*length))
-            neighbours.append((x, y - 1*length))
-        elif self.connections == 6:
-            # Neighbours along 6 directions.
-            d = math.sqrt(3)/2
-            neighbours.append((x + 1*length, y))
-            neighbours.append((x - 1*length, y))
-            neighbours.append((x - 0.5*length, y - d*length))
-            neighbours.append((x + 0.5*length, y - d*length))
-            neighbours.append((x - 0.5*length, y + d*length))
-            neighbours.append((x + 0.5*length, y + d*length))
-        elif self.connections == 8:
-            # Neighbours along x, y, x-y, and x+y.
-            neighbours.append((x + 1*length, y))
-            neighbours.append((x + 1*length, y + 1*length))
-            neighbours.append((x, y + 1*length))
-            neighbours.append((x - 1*length, y + 1*length))
-            neighbours.append((x - 1*length, y))
-            neighbours.append((x - 1*length, y - 1*length))
-            neighbours.append((x, y - 1*length))
-            neighbours.append((x + 1*length, y - 1*length))
-        else:
+        i, j = self.index
+        return [Node((i + di, j + dj), self.connections)
+                for di, dj in Directions(self.connections).offsets(i, j)]
+
+
+class Directions(object):
+    """Tables over the neighbour directions of one lattice type, built from
+    its LatticeType.
+
+    Directions are numbered over all sublattices in turn: direction
+    first[s] + k is step k of sublattice s, steps[first[s] + k]. lengths[k]
+    is the length of an edge along k and weights[k_in][k_out] the weight of
+    heading along k_out after arriving along k_in, from the angle between
+    them, i.e. the case of Neuron.local_sample() it falls in. Tables are
+    built once per lattice type; cumulative weights for each set of
+    available directions are built on first use, so that a weighted draw is
+    a single bisection.
+    """
+
+    # Tables, keyed by connections.
+    _interned = {}
+
+    def __new__(cls, connections):
+        table = cls._interned.get(connections)
+        if table is None:
+            table = object.__new__(cls)
+            table._build(connections)
+            cls._interned[connections] = table
+        return table
+
+    def _build(self, connections):
+        try:
+            kind = LATTICE_TYPES[connections]
+        except KeyError:
             raise ErrorConnectionNumber()
+        self.connections = connections
+        self.kind = kind
+        self.degree = len(kind.steps[0])
+        self.weighted = kind.turns is not None
+        self.random_hands = kind.random_hands
+        self.first = [s * self.degree for s in range(len(kind.steps))]
+        self.steps = [step for steps in kind.steps for step in steps]
+        self.index = {}
+        self.vectors = []
+        for s, steps in enumerate(kind.steps):
+            origin = self._representative(s)
+            p = self.coor(origin)
+            for k, step in enumerate(steps):
+                self.index[(s, step)] = self.first[s] + k
+                q = self.coor((origin[0] + step[0], origin[1] + step[1]))
+                self.vectors.append((q[0] - p[0], q[1] - p[1]))
+        self.lengths = [math.hypot(x, y) for x, y in self.vectors]
+        self.weights = [[self._weight(d1, d) for d in self.vectors]
+                        for d1 in self.vectors]
+        # (directions, cumulative weights), keyed by (k_in, available mask).
+        self._cumulative = {}
+
+    def _representative(self, s):
+        """Index of a site of sublattice s."""
+        m = self.kind.sublattice[2]
+        for i, j in product(range(m), range(m)):
+            if self.sublattice(i, j) == s:
+                return (i, j)
+
+    def _weight(self, d1, d):
+        """Weight of heading along d after arriving along d1."""
+        if not self.weighted:
+            # No local structure.
+            return 1
+        cos = (d1[0] * d[0] + d1[1] * d[1]) / (math.hypot(*d1) * math.hypot(*d))
+        angle = int(round(math.degrees(math.acos(max(-1.0, min(1.0, cos))))))
+        name = self.kind.turns.get(angle)
+        if name is None:
+            # A turn that does not occur, between steps of one sublattice.
+            return 0
+        return getattr(settings, name)
+
+    def sublattice(self, i, j):
+        """Sublattice of index (i, j)."""
+        a, b, m = self.kind.sublattice
+        return (a * i + b * j) % m
+
+    def offsets(self, i, j):
+        """Neighbour offsets of index (i, j)."""
+        return self.kind.steps[self.sublattice(i, j)]
+
+    def coor(self, index):
+        """(x, y) float coordinates of index."""
+        length = settings.UNIT_PATH_LENGTH
+        i, j = index
+        (xi, yi), (xj, yj) = self.kind.basis
+        x0, y0 = self.kind.shifts[self.sublattice(i, j)]
+        return (float((i*xi + j*xj + x0) * length),
+                float((i*yi + j*yj + y0) * length))
+
+    def find(self, index, step):
+        """Direction of step from index, None if step does not lead to a
+        neighbour."""
+        return self.index.get((self.sublattice(*index), step))
+
+    def direction(self, origin, dest):
+        """Direction of the step from node origin to node dest, None if dest
+        is not a neighbour of origin."""
+        i, j = origin.index
+        return self.find(origin.index, (dest.index[0] - i, dest.index[1] - j))
+
+    def length(self, origin, dest):
+        """Distance between nodes origin and dest."""
+        k = self.direction(origin, dest)
+        if k is not None:
+            return self.lengths[k]
+        p1, p2 = origin.coor, dest.coor
+        return math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+
+    def sample(self, k_in, ways, n, rng=random):
+        """Choose up to n distinct directions out of ways, weighted by
+        weights[k_in]. Stop early when the remaining ways all weigh zero.
+        Return the chosen directions in the order they were drawn."""
+        mask = 0
+        for k in ways:
+            mask |= 1 << k
+        chosen = []
+        while len(chosen) < n:
+            key = (k_in, mask)
+            table = self._cumulative.get(key)
+            if table is None:
+                table = self._cumulative[key] = self._table(k_in, mask)
+            keys, cumulative = table
+            if not keys or cumulative[-1] == 0:
+                break
+            a = rng.random() * cumulative[-1]
+            k = keys[min(bisect_right(cumulative, a), len(keys) - 1)]
+            chosen.append(k)
+            mask &= ~(1 << k)
+        return chosen
+
+    def _table(self, k_in, mask):
+        """Available directions and their cumulative weights."""
+        weights = self.weights[k_in]
+        keys = [k for k in range(len(self.vectors)) if mask >> k & 1]
+        cumulative = []
+        c = 0
+        for k in keys:
+            c = c + weights[k]
+            cumulative.append(c)
+        return keys, cumulative
+
+
+class Lattice(object):
+    """A finite window of one lattice type with precomputed neighbour tables.
+
+    Sites are the nodes with index (i, j) where imin <= i < imin + ni and
+    jmin <= j < jmin + nj, numbered row by row. The neighbour table is stored
+    in compressed form: neighbours of site s are
+    indices[offsets[s]:offsets[s + 1]], in the order of Node.neighbours, and
+    directions holds the Directions number of each entry. Neighbours falling
+    outside the window are left out.
+
+    A periodic window is a torus: indices wrap around modulo ni and nj, every
+    site has all its neighbours and any node maps to a site. Nodes in the
+    window stand for all their periodic images.
+    """
 
-        # Convert neighbour coordinates to neighbour nodes.
-        neighbour_nodes = []
-        for coor in neighbours:
-            node = Node(coor, self.connections)
-            neighbour_nodes.append(node)
-        return neighbour_nodes
+    def __init__(self, connections, imin, jmin, ni, nj, periodic=False):
+        table = Directions(connections)
+        a, b, m = table.kind.sublattice
+        if periodic and min(ni, nj) < 3:
+            # Steps of +1 and -1 would lead to the same site.
+            raise ValueError('A periodic lattice needs 3 sites or more along each index.')
+        if periodic and (a * ni % m or b * nj % m):
+            raise ValueError('A periodic lattice must wrap sublattices onto themselves.')
+
+        self.connections = connections
+        self.degree = table.degree
+        self.steps = table.steps
+        self.imin, self.jmin = imin, jmin
+        self.ni, self.nj = ni, nj
+        self.size = ni * nj
+        self.periodic = periodic
+
+        sites = np.arange(self.size)
+        i, j = sites // nj, sites % nj
+        # Sublattice of each site, one scalar for lattices of one sublattice.
+        sublattice = (a * (i + imin) + b * (j + jmin)) % m if m > 1 else 0
+        steps = np.array(table.kind.steps)
+        neighbours = np.full((self.size, self.degree), -1, dtype=np.int64)
+        for k in range(self.degree):
+            di, dj = steps[sublattice, k, 0], steps[sublattice, k, 1]
+            if periodic:
+                neighbours[:, k] = (i + di) % ni * nj + (j + dj) % nj
+                continue
+            inside = (i + di >= 0) & (i + di < ni) & (j + dj >= 0) & (j + dj < nj)
+            neighbours[inside, k] = (i + di)[inside] * nj + (j + dj)[inside]
+        valid = neighbours >= 0
+
+        self.offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=self.offsets[1:])
+        self.indices = neighbours[valid].astype(np.int32)
+        first = np.reshape(np.array(table.first)[sublattice], (-1, 1))
+        self.directions = np.broadcast_to(first + np.arange(self.degree),
+                                          valid.shape)[valid].astype(np.int8)
+
+        # Neighbour nodes, and (neighbour sites, directions) lists, per site,
+        # built from the table on first use.
+        self._neighbours = [None] * self.size
+        self._rows = [None] * self.size
+
+    @classmethod
+    def around(cls, connections, indices, reach):
+        """Smallest window holding all indices plus reach sites on each side.
+        indices - (i, j) pairs, or an array of them."""
+        indices = np.asarray(indices)
+        i, j = indices[:, 0], indices[:, 1]
+        imin, jmin = int(i.min()) - reach, int(j.min()) - reach
+        return cls(connections, imin, jmin,
+                   int(i.max()) + reach + 1 - imin, int(j.max()) + reach + 1 - jmin)
+
+    @classmethod
+    def torus(cls, connections, indices):
+        """Periodic window spanning the range of indices."""
+        indices = np.asarray(indices)
+        i, j = indices[:, 0], indices[:, 1]
+        imin, jmin = int(i.min()), int(j.min())
+        return cls(connections, imin, jmin, int(i.max()) + 1 - imin,
+                   int(j.max()) + 1 - jmin, periodic=True)
+
+    def site(self, node):
+        """Site number of node, -1 if node is outside the window."""
+        i = node.index[0] - self.imin
+        j = node.index[1] - self.jmin
+        if self.periodic:
+            return i % self.ni * self.nj + j % self.nj
+        if 0 <= i < self.ni and 0 <= j < self.nj:
+            return i * self.nj + j
+        return -1
+
+    def sites(self, i, j):
+        """Site numbers of indices (i, j) given as arrays, -1 outside the
+        window."""
+        i = np.asarray(i) - self.imin
+        j = np.asarray(j) - self.jmin
+        if self.periodic:
+            return i % self.ni * self.nj + j % self.nj
+        inside = (i >= 0) & (i < self.ni) & (j >= 0) & (j < self.nj)
+        return np.where(inside, i * self.nj + j, -1)
+
+    def node(self, site):
+        """Node at site number site."""
+        i, j = divmod(int(site), self.nj)
+        return Node((i + self.imin, j + self.jmin), self.connections)
+
+    def neighbour_sites(self, site):
+        """Site numbers of the neighbours of site."""
+        return self.indices[self.offsets[site]:self.offsets[site + 1]]
+
+    def neighbours(self, node):
+        """Neighbour nodes of node.
+        Fall back to Node.neighbours for nodes on the edge of or outside the
+        window, whose neighbours are not all in the table."""
+        site = self.site(node)
+        if site < 0:
+            return node.neighbours
+        neighbours = self._neighbours[site]
+        if neighbours is None:
+            sites = self.neighbour_sites(site)
+            if len(sites) < self.degree:
+                neighbours = tuple(node.neighbours)
+            else:
+                neighbours = tuple(self.node(x) for x in sites)
+            self._neighbours[site] = neighbours
+        return neighbours
+
+    def direction(self, origin, dest):
+        """Direction of the step from node origin to its neighbour dest,
+        across the edges of a periodic window."""
+        di = dest.index[0] - origin.index[0]
+        dj = dest.index[1] - origin.index[1]
+        if self.periodic:
+            di = (di + 1) % self.ni - 1
+            dj = (dj + 1) % self.nj - 1
+        return Directions(self.connections).find(origin.index, (di, dj))
+
+    def unwrap(self, origin, dest):
+        """Image of neighbour dest next to origin, for drawing. dest itself
+        unless the edge crosses the edge of a periodic window."""
+        if not self.periodic:
+            return dest
+        di, dj = self.steps[self.direction(origin, dest)]
+        return Node((origin.index[0] + di, origin.index[1] + dj), self.connections)
+
+    def row(self, site):
+        """(neighbour sites, directions) of site as lists, for scalar access.
+        Neighbours outside the window are left out."""
+        row = self._rows[site]
+        if row is None:
+            start, end = self.offsets[site], self.offsets[site + 1]
+            row = self._rows[site] = (self.indices[start:end].tolist(),
+                                      self.directions[start:end].tolist())
+        return row
+
+
+class ChunkedLattice(object):
+    """An unbounded lattice of one type, numbered chunk by chunk.
+
+    The lattice is cut into square chunks of side x side sites. Chunks get a
+    number the first time one of their sites or a neighbour of them is looked
+    up, and site (li, lj) of chunk c is site number (c * side + li) * side +
+    lj. Arrays indexed by site number thus grow by whole chunks, with memory
+    proportional to the area neurons actually reach, and a site is found
+    from its node with one dict lookup. Neighbour rows are built chunk by
+    chunk on first use. Same interface as Lattice, with size growing as
+    chunks are added.
+    """
+
+    periodic = False
 
+    def __init__(self, connections, side=32):
+        self._table = table = Directions(connections)
 
-class Path():
+        self.connections = connections
+        self.degree = table.degree
+        self.steps = table.steps
+        self.side = side
+        # (ci, cj) -> number of the chunk with corner (ci * side, cj * side).
+        self.chunks = {}
+        self.corners = []
+        # Neighbour rows of each chunk, built on first use.
+        self._rows = []
+        # Directions of the sites of each sublattice.
+        self._directions = [list(range(x, x + self.degree)) for x in table.first]
+
+    @property
+    def size(self):
+        """Number of sites of the chunks numbered so far."""
+        return len(self.corners) * self.side * self.side
+
+    def _site(self, i, j):
+        """Site number of index (i, j), numbering its chunk if new."""
+        side = self.side
+        ci, li = divmod(i, side)
+        cj, lj = divmod(j, side)
+        chunk = self.chunks.get((ci, cj))
+        if chunk is None:
+            chunk = self.chunks[(ci, cj)] = len(self.corners)
+            self.corners.append((ci * side, cj * side))
+            self._rows.append(None)
+        return (chunk * side + li) * side + lj
+
+    def site(self, node):
+        """Site number of node."""
+        return self._site(*node.index)
+
+    def sites(self, i, j):
+        """Site numbers of indices (i, j) given as arrays."""
+        return np.array([self._site(a, b) for a, b in
+                         zip(np.asarray(i).tolist(), np.asarray(j).tolist())],
+                        dtype=np.int64)
+
+    def node(self, site):
+        """Node at site number site."""
+        side = self.side
+        chunk, local = divmod(int(site), side * side)
+        li, lj = divmod(local, side)
+        i, j = self.corners[chunk]
+        return Node((i + li, j + lj), self.connections)
+
+    def row(self, site):
+        """(neighbour sites, directions) of site as lists."""
+        side = self.side
+        chunk, local = divmod(site, side * side)
+        rows = self._rows[chunk]
+        if rows is None:
+            ci, cj = self.corners[chunk]
+            table = self._table
+            rows = []
+            for i, j in product(range(ci, ci + side), range(cj, cj + side)):
+                s = table.sublattice(i, j)
+                rows.append(([self._site(i + di, j + dj) for di, dj in table.kind.steps[s]],
+                             self._directions[s]))
+            self._rows[chunk] = rows
+        return rows[local]
+
+    def neighbour_sites(self, site):
+        """Site numbers of the neighbours of site."""
+        return self.row(site)[0]
+
+    def neighbours(self, node):
+        """Neighbour nodes of node."""
+        return node.neighbours
+
+    def direction(self, origin, dest):
+        """Direction of the step from node origin to its neighbour dest."""
+        return Directions(self.connections).direction(origin, dest)
+
+    def unwrap(self, origin, dest):
+        return dest
+
+
+class Path(object):
+
+    __slots__ = ('origin', 'dest', 'length', '_max_length', 'alive')
 
     def __repr__(self):
         return "({n1[0]}, {n1[1]}) -> ({n2[0]}, {n2[1]}), {length}".format(
@@ -104,27 +574,26 @@ class Path():
     def __hash__(self):
         return (hash(self.origin) ^ hash(self.dest) ^ hash(self.length))
 
-    def __init__(self, origin, dest, length=0):
+    def __init__(self, origin, dest, length=0, max_length=None):
         """Initiate a path.
         origin - the origin node,
         dest - the destination node,
-        length - the occupied length of this path."""
+        length - the occupied length of this path,
+        max_length - length of the edge, from the nodes if None."""
         self.origin = origin
         self.dest = dest
         self.length = length
-        self._max_length = False
+        self._max_length = max_length
         # Default alive.
         self.alive = True
 
     @property
     def max_length(self):
         """Return the max length allowed in this path."""
-        if self._max_length:
-            return self._max_length
-        else:
-            path = np.array(self.origin.coor) - np.array(self.dest.coor)
-            self._max_length = np.linalg.norm(path)
-            return self._max_length
+        if self._max_length is None:
+            self._max_length = Directions(self.origin.connections).length(
+                self.origin, self.dest)
+        return self._max_length
 
     def died(self):
         # Turn a path to dead.
@@ -135,6 +604,117 @@ class Path():
         self.length += distance
 
 
+class Sites(MutableSequence):
+    """A list of nodes with constant time membership tests.
+
+    Wraps a list and keeps the number of times each node appears in it, so
+    that `node in sites` is a dict lookup instead of a scan. Every change
+    goes through the methods below, so that the counts cannot go stale.
+    With an origin node, radius is the largest distance from origin to a
+    node added so far.
+    """
+
+    def __init__(self, nodes=(), origin=None):
+        self._nodes = list(nodes)
+        self._count = {}
+        self.origin = origin
+        self.radius = 0.0
+        for node in self._nodes:
+            self._add(node)
+
+    def __reduce__(self):
+        return (Sites, (self._nodes, self.origin))
+
+    def __repr__(self):
+        return 'Sites({0!r})'.format(self._nodes)
+
+    def __eq__(self, other):
+        if isinstance(other, Sites):
+            other = other._nodes
+        return self._nodes == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __getitem__(self, i):
+        return self._nodes[i]
+
+    def __contains__(self, node):
+        return node in self._count
+
+    def _add(self, node):
+        count = self._count.get(node, 0)
+        if not count and self.origin is not None:
+            x0, y0 = self.origin.coor
+            x, y = node.coor
+            self.radius = max(self.radius, math.hypot(x - x0, y - y0))
+        self._count[node] = count + 1
+
+    def _discard(self, node):
+        count = self._count[node] - 1
+        if count:
+            self._count[node] = count
+        else:
+            del self._count[node]
+
+    def append(self, node):
+        self._nodes.append(node)
+        self._add(node)
+
+    def extend(self, nodes):
+        for node in nodes:
+            self.append(node)
+
+    def __iadd__(self, nodes):
+        self.extend(nodes)
+        return self
+
+    def insert(self, i, node):
+        self._nodes.insert(i, node)
+        self._add(node)
+
+    def remove(self, node):
+        self._nodes.remove(node)
+        self._discard(node)
+
+    def pop(self, i=-1):
+        node = self._nodes.pop(i)
+        self._discard(node)
+        return node
+
+    def clear(self):
+        del self._nodes[:]
+        self._count.clear()
+
+    def __setitem__(self, i, value):
+        removed = self._nodes[i]
+        if isinstance(i, slice):
+            value = list(value)
+            self._nodes[i] = value
+            for node in value:
+                self._add(node)
+            for node in removed:
+                self._discard(node)
+        else:
+            self._nodes[i] = value
+            self._discard(removed)
+            self._add(value)
+
+    def __delitem__(self, i):
+        removed = self._nodes[i]
+        del self._nodes[i]
+        for node in (removed if isinstance(i, slice) else [removed]):
+            self._discard(node)
+
+
 class Neuron(object):
     """A neuron is a collection of Nodes and Paths.
     It grows as time passes.
@@ -145,22 +725,55 @@ class Neuron(object):
     speed = settings.GROW_SPEED
     # Split probability.
     split_prob = settings.SPLIT_PROBABILITY
-
-    def __init__(self, origin):
+    # What clean() keeps of completed paths: 'paths' keeps the Path objects
+    # in self.paths, 'sites' only the site numbers of both ends in
+    # self.edges (needs a lattice; paths leaving its window stay in
+    # self.paths), None nothing. Completed paths are only
+    # needed for drawing and export.
+    completed = 'paths'
+    # Source of random numbers, with the interface of random.
+    rng = random
+
+    def __init__(self, origin, lattice=None):
         """Initialize a neuron instance.
         origin - root node.
-        vertex - number of neighbour nodes."""
+        lattice - optional Lattice used to look up neighbours."""
 
         self.origin = origin
+        self.lattice = lattice
 
-        self.nodes = [self.origin]
-        self.boundary_nodes = []
+        # Occupied and heading-to nodes, with constant time membership.
+        self.nodes = Sites([self.origin], origin=origin)
+        self.boundary_nodes = Sites(origin=origin)
         self.paths = []
+        # Completed edges as origin and destination site numbers, flat.
+        self.edges = array('l')
         self.boundary_paths = []
+        # Alive boundary paths, the only ones grow() visits.
+        self.growing = []
+
+        # Boundary paths by origin node, and number of neighbours of each
+        # such origin that are not in self.nodes. Origins whose count drops
+        # to zero wait in _exhausted for check_alive().
+        self.frontier = {}
+        self.free = {}
+        self._exhausted = set()
+
+        # Growth counters, as in ArrayEngine: growing paths, paths that
+        # stopped for good, completed paths, splits and neurite length.
+        self.n_live = 0
+        self.n_dead = 0
+        self.n_edges = 0
+        self.n_splits = 0
+        self.neurite_length = 0.0
 
         # Not connected immediately after creation.
         self.connected = False
 
+        # Set when the neuron is added to an Occupancy.
+        self.id = None
+        self.occupancy = None
+
     def connect(self):
         # Trun self.connected to True.
         self.connected = True
@@ -169,22 +782,94 @@ class Neuron(object):
     def vertex(self):
         return self.origin.connections
 
+    @property
+    def radius(self):
+        """Largest distance from origin to the nodes added to self.nodes
+        and self.boundary_nodes, kept by them as nodes come. Two neurons
+        further apart than the sum of their radii do not touch."""
+        return max(self.nodes.radius, self.boundary_nodes.radius)
+
+    def neighbours(self, node):
+        """Neighbour nodes of node, from self.lattice when available."""
+        if self.lattice is None:
+            return node.neighbours
+        return self.lattice.neighbours(node)
+
+    def direction(self, origin, dest):
+        """Direction of the step from origin to its neighbour dest, from
+        self.lattice when available."""
+        if self.lattice is None:
+            return Directions(self.vertex).direction(origin, dest)
+        return self.lattice.direction(origin, dest)
+
+    def _path(self, origin, dest, length=0):
+        """New path from origin to its neighbour dest."""
+        k = self.direction(origin, dest)
+        return Path(origin, dest, length, Directions(self.vertex).lengths[k])
+
+    def _unwrap(self, origin, dest):
+        """Image of dest next to origin, see Lattice.unwrap()."""
+        if self.lattice is None:
+            return dest
+        return self.lattice.unwrap(origin, dest)
+
+    def _add_path(self, path):
+        """Append a new boundary path heading to path.dest."""
+        self.boundary_nodes.append(path.dest)
+        self.boundary_paths.append(path)
+        self.growing.append(path)
+        self.n_live += 1
+        self.neurite_length += path.length
+        if self.occupancy is not None:
+            self.occupancy.add_path(path, self.id)
+        tips = self.frontier.get(path.origin)
+        if tips is None:
+            tips = self.frontier[path.origin] = []
+            self.free[path.origin] = len(
+                [x for x in self.neighbours(path.origin) if x not in self.nodes])
+        tips.append(path)
+
+    def _drop_path(self, path):
+        """Forget a completed boundary path in self.frontier."""
+        if self.occupancy is not None:
+            self.occupancy.retire_path(path, self.id)
+        tips = self.frontier[path.origin]
+        for i, x in enumerate(tips):
+            if x is path:
+                del tips[i]
+                break
+        if not tips:
+            del self.frontier[path.origin]
+            del self.free[path.origin]
+            self._exhausted.discard(path.origin)
+
+    def _reach(self, node):
+        """Add node to self.nodes. Frontier nodes next to it lose a free
+        neighbour."""
+        new = node not in self.nodes
+        self.nodes.append(node)
+        if self.occupancy is not None:
+            self.occupancy.claim(node, self.id)
+        if not new:
+            return
+        for x in self.neighbours(node):
+            if x in self.free:
+                self.free[x] -= 1
+                if not self.free[x]:
+                    self._exhausted.add(x)
+
     @property
     def hands(self):
         """Return number of initial hands for neuron.
-        Randomly chose from (4,5,6) if self.vertex == 6 to ensure that
-        not all neurons have the same number of hands."""
-        if self.vertex == 2:
-            return 2
-        elif self.vertex == 3:
-            return 3
-        elif self.vertex == 4:
-            return 4
-        elif self.vertex == 6 or self.vertex == 8:
-            # Choose randomly from range(Hands_low, Hands_high + 1)
-            return random.randrange(settings.Hands_low, settings.Hands_high + 1, 1)
-        else:
+        One per neighbour, or drawn from Hands_low to Hands_high for lattice
+        types with random_hands (6 and 8), so that not all neurons have the
+        same number of hands."""
+        if self.vertex not in LATTICE_TYPES:
             raise ErrorHandsNumber()
+        if Directions(self.vertex).random_hands:
+            # Choose randomly from range(Hands_low, Hands_high + 1)
+            return self.rng.randrange(settings.Hands_low, settings.Hands_high + 1, 1)
+        return self.vertex
 
     def born(self):
         """Grow hands to init self.nodes, self.boundary_nodes,
@@ -192,30 +877,29 @@ class Neuron(object):
         Determine grow directions but do not grow now."""
 
         # Choose boundary nodes from all neighbours.
-        index = random.sample(range(self.vertex), self.hands)
+        index = self.rng.sample(range(self.vertex), self.hands)
         # Sort index for easier test.
         index.sort()
 
+        neighbours = self.neighbours(self.origin)
         for i in index:
             # Update boundary_nodes and boundary_paths.
-            node = self.origin.neighbours[i]
-            self.boundary_nodes.append(node)
-            path = Path(self.origin, node)
-            self.boundary_paths.append(path)
+            self._add_path(self._path(self.origin, neighbours[i]))
 
     def grow(self):
         """Increase length for each alive path in boundary_paths.
         Do not validate paths now. Validate in self.clean().
         """
-        for path in self.boundary_paths:
+        for path in self.growing:
             if path.alive:
                 path.length += self.speed
+        self.neurite_length += self.speed * self.n_live
 
     def split_check(self):
         """Check if need split when a path exceeds path.max_length."""
 
         # Split or not.
-        p = random.random()
+        p = self.rng.random()
         split = True if p < settings.SPLIT_PROBABILITY else False
 
         return split
@@ -224,8 +908,8 @@ class Neuron(object):
         """Available neighbours of a node. Available means that this neighbour
         is not currently occupied by this neuron."""
         avail = []
-        for neighbour in node.neighbours:
-            if neighbour not in (self.nodes + self.boundary_nodes):
+        for neighbour in self.neighbours(node):
+            if neighbour not in self.nodes and neighbour not in self.boundary_nodes:
                 avail.append(neighbour)
         return avail
 
@@ -261,151 +945,135 @@ class Neuron(object):
                     return self.local_sample(possible_nodes, node, origin, 1)
             else:
                 if split:
-                    return random.sample(possible_nodes, 2)
+                    return self.rng.sample(possible_nodes, 2)
                 else:
-                    return random.sample(possible_nodes, 1)
+                    return self.rng.sample(possible_nodes, 1)
 
     def local_sample(self, nodes, node, origin, n):
         """Choose n elements from nodes according to their weighted probability
         which is determined by their local structure with respect to origin and
-        node."""
-
-        # Generate (node, weighted_prob) pairs.
-        prob = []
-        d1 = np.array(node.coor) - np.array(origin.coor)
-        if node.connections == 2:
-            return random.sample(nodes, n)
-        elif node.connections == 4:
-            for neighbour in nodes:
-                d = np.array(neighbour.coor) - np.array(node.coor)
-                if abs(np.dot(d1, d)) < 0.01:
-                    # Case 1 in 4 connected canvas: go left or right.
-                    prob.append((neighbour, settings.P4_1))
-                else:
-                    # Case 2 in 4 connected canvas: go directly.
-                    prob.append((neighbour, settings.P4_2))
-        elif node.connections == 6:
-            for neighbour in nodes:
-                d = np.array(neighbour.coor) - np.array(node.coor)
-                if np.dot(d1, d) < 0:
-                    # Case 1 in 6 connected canvas: go back.
-                    prob.append((neighbour, settings.P6_1))
-                elif abs(np.dot(d1, d) - settings.UNIT_PATH_LENGTH ** 2 / 2.0) < 0.01:
-                    # Case 2 in 6 connected canvas: turn left/right 60 degrees.
-                    prob.append((neighbour, settings.P6_2))
-                else:
-                    # Case 3 in 6 connected canvas: go directly.
-                    prob.append((neighbour, settings.P6_3))
-        elif node.connections == 8:
-            for neighbour in nodes:
-                d = np.array(neighbour.coor) - np.array(node.coor)
-                if np.dot(d1, d) < 0:
-                    # Case 1 in 8 connected canvas: go back.
-                    prob.append((neighbour, settings.P8_1))
-                elif abs(np.dot(d1, d)) < 0.01:
-                    # Case 2 in 8 connected canvas: turn left/right 90 degrees.
-                    prob.append((neighbour, settings.P8_2))
-                elif abs(np.dot(d1, d) - settings.UNIT_PATH_LENGTH ** 2 * math.sqrt(2)) < 0.01:
-                    # Case 3 in 8 connected canvas: turn left/right 45 degrees.
-                    prob.append((neighbour, settings.P8_3))
-                else:
-                    # Case 4 in 8 connected canvas: go directly.
-                    prob.append((neighbour, settings.P8_4))
-
-        # Sample from possible nodes.
-        real_way = []
-        if n <= len(nodes):
-            while len(real_way) < n:
-                # Random number between 0 and sum of all probs.
-                if sum([x[1] for x in prob]) == 0:
-                    break
-                a = random.random() * sum([x[1] for x in prob])
-                c = 0
-                for item in prob:
-                    # Check which node is selected by random variable a.
-                    # Each node can be selected only for once.
-                    c = c + item[1]
-                    if a < c:
-                        real_way.append(item[0])
-                        del item
-                        break
-        return real_way
+        node. Each node is chosen at most once."""
 
-    def clean(self, local=True):
-        """Validate boundary_paths and boundary_nodes.
-        local=True for cases that path.length is more than twice of max_length."""
+        table = Directions(node.connections)
+        if not table.weighted:
+            return self.rng.sample(nodes, n)
+        if n > len(nodes):
+            return []
 
-        # Boundary nodes and paths to delete.
-        nodes_to_del = []
-        paths_to_del = []
+        ways = {}
+        for neighbour in nodes:
+            ways[self.direction(node, neighbour)] = neighbour
+        chosen = table.sample(self.direction(origin, node), ways, n, rng=self.rng)
+        return [ways[k] for k in chosen]
 
-        # Check for each path in boundary_paths.
-        for path in self.boundary_paths:
-            if path.length > path.max_length:
-                """
-                Append to to_del list. Use deep copy in case of path
-                changing
-                """
-                path_copy = copy.deepcopy(path)
-                # paths_to_del.append(path_copy)
-                nodes_to_del.append(path_copy.dest)
-                # New length.
-                new_length = path.length - path.max_length
-                # Convert path.length to max_length to prepare for be appended.
-                path.length = path.max_length
-                # Append path, node to self.paths, self.nodes
+    def clean(self, local=True):
+        """Validate boundary_paths and boundary_nodes.
+        local=True for cases that path.length is more than twice of max_length.
+
+        Paths past their destination are handled from a work list. New paths
+        that are already past their own destination join the list, so a
+        path overshooting several nodes is resolved in one pass."""
+
+        # Paths past their destination, in boundary_paths order.
+        queue = deque(x for x in self.boundary_paths if x.length > x.max_length)
+        if not queue:
+            return
+
+        # Completed paths (by identity) and their destination nodes.
+        done = set()
+        reached = set()
+
+        while queue:
+            path = queue.popleft()
+            done.add(id(path))
+            reached.add(path.dest)
+            # New length.
+            new_length = path.length - path.max_length
+            # Convert path.length to max_length to prepare for be appended.
+            path.length = path.max_length
+            # The path counts for its own length, new paths for theirs.
+            self.n_live -= 1
+            self.n_edges += 1
+            self.neurite_length -= new_length
+            # Keep path as asked by self.completed, append node to self.nodes.
+            self._complete(path)
+            self._drop_path(path)
+            self._reach(path.dest)
+
+            # Check new nodes.
+            if local:
+                new_nodes = self.way_to_go(path.dest, self.split_check(), local=True, origin=path.origin)
+            else:
+                new_nodes = self.way_to_go(path.dest, self.split_check())
+            if not new_nodes:
+                self.n_dead += 1
+            elif len(new_nodes) == 2:
+                self.n_splits += 1
+
+            # Each node in new_nodes is a new destination.
+            for dest in new_nodes or []:
+                # Init new path from old destination to new destination.
+                new_path = self._path(path.dest, dest, new_length)
+                self._add_path(new_path)
+                if new_path.length > new_path.max_length:
+                    queue.append(new_path)
+
+        # Drop completed paths and reached nodes in one sweep, keeping order.
+        self.boundary_paths[:] = [x for x in self.boundary_paths if id(x) not in done]
+        self.growing[:] = [x for x in self.growing if id(x) not in done]
+        self.boundary_nodes[:] = [x for x in self.boundary_nodes if x not in reached]
+
+    def _complete(self, path):
+        """Keep completed path as asked by self.completed."""
+        if self.completed == 'paths':
+            self.paths.append(path)
+        elif self.completed == 'sites':
+            if self.lattice is None:
+                raise ValueError("completed='sites' needs a lattice")
+            origin = self.lattice.site(path.origin)
+            dest = self.lattice.site(path.dest)
+            if origin < 0 or dest < 0:
+                # Outside the lattice window, keep the Path.
                 self.paths.append(path)
-                self.nodes.append(path.dest)
-
-                paths_to_del.append(path)
-
-                # Check new nodes.
-                if local:
-                    new_nodes = self.way_to_go(path.dest, self.split_check(), local=True, origin=path.origin)
-                else:
-                    new_nodes = self.way_to_go(path.dest, self.split_check())
-
-                if not new_nodes:
-                    # No new path available.
-                    pass
-                else:
-                    # Each node in new_nodes is a new destination.
-                    for dest in new_nodes:
-                        # Append new destination node to self.boundary_nodes.
-                        self.boundary_nodes.append(dest)
-                        # Init new path from old destination to new destination.
-                        new_path = Path(path.dest, dest, new_length)
-                        # Append new path to boundary_paths.
-                        self.boundary_paths.append(new_path)
-
-        """
-        Delete nodes and paths in nodes_to_del and paths_to_del from
-        self.nodes and self.paths.
-        """
-        for node in nodes_to_del:
-            while node in self.boundary_nodes:
-                del self.boundary_nodes[self.boundary_nodes.index(node)]
-
-        for path in paths_to_del:
-            while path in self.boundary_paths:
-                del self.boundary_paths[self.boundary_paths.index(path)]
+            else:
+                self.edges.append(origin)
+                self.edges.append(dest)
 
-        # Continue check until all boundary paths have reasonable length.
-        if any([x.length > x.max_length for x in self.boundary_paths]):
-            self.clean(local=local)
+    def completed_edges(self):
+        """(origin, dest) nodes of the completed paths kept, whichever way
+        they are kept."""
+        for path in self.paths:
+            yield path.origin, path.dest
+        edges = self.edges
+        for k in range(0, len(edges), 2):
+            yield self.lattice.node(edges[k]), self.lattice.node(edges[k + 1])
 
     def check_alive(self):
         """Check paths in self.boundary_paths, if no possible next_node,
-        turn them to dead."""
-        for path in self.boundary_paths:
-            node = path.origin
-            if all([x in self.nodes for x in node.neighbours]):
-                path.died()
+        turn them to dead.
+        Only paths from origins that ran out of free neighbours since the
+        last call are visited."""
+        if not self._exhausted:
+            return
+        for node in self._exhausted:
+            for path in self.frontier[node]:
+                if path.alive:
+                    path.died()
+                    self.n_live -= 1
+                    self.n_dead += 1
+        self._exhausted.clear()
+        self.growing[:] = [x for x in self.growing if x.alive]
+
+    def growth(self):
+        """Return (growing paths, dead paths, neurite length, completed
+        paths, splits), as ArrayEngine.growth()."""
+        return (self.n_live, self.n_dead, self.neurite_length, self.n_edges,
+                self.n_splits)
 
     def cal_end(self, path):
         """Calculate coordinates for endpoint for a path."""
         p1 = path.origin.coor
-        p2 = path.dest.coor
+        p2 = self._unwrap(path.origin, path.dest).coor
         l = float(path.length)
         m = path.max_length
         # Calculate x and y
@@ -422,19 +1090,487 @@ class Neuron(object):
         coor = node.coor
         draw.ellipse([(coor[0] - 5, coor[1] - 5), (coor[0] + 10, coor[1] + 10)], fill=color)
         # Draw full paths.
-        for path in self.paths:
-            line = [path.origin.coor, path.dest.coor]
-            draw.line(line, fill=color, width=3)
+        for origin, dest in self.completed_edges():
+            draw_edge(draw, origin, dest, color, lattice=self.lattice)
 
         # Draw partial paths.
         for path in self.boundary_paths:
-            line = [path.origin.coor, self.cal_end(path)]
-            draw.line(line, fill=color, width=3)
+            draw_edge(draw, path.origin, path.dest, color,
+                      float(path.length) / path.max_length, self.lattice)
+
+
+class Occupancy(object):
+    """Lattice-wide record of the neurons occupying each site.
+
+    owner holds the first neuron to claim each site of the lattice, growing
+    with a ChunkedLattice, and shared holds all owners of the sites claimed
+    more than once. Neurons report each
+    node they claim, so a connection is found the moment a node is claimed by
+    a second neuron instead of comparing node lists pair by pair. Connection
+    events are merged into clusters, a Clusters tracker.
+    """
+
+    def __init__(self, neurons, lattice=None):
+        """neurons - the list of neurons, numbered by their position.
+        lattice - the neurons' Lattice by default."""
+        self.neurons = list(neurons)
+        self.lattice = lattice if lattice is not None else self.neurons[0].lattice
+        self.owner = np.full(self.lattice.size, -1, dtype=np.int32)
+        # Site -> owners for shared sites, node -> owners outside the lattice.
+        self.shared = {}
+        # (id, id) pairs of neurons that met since last check_connections().
+        self.contacts = []
+        # Undirected edge -> [(owner, path)] boundary paths growing on it.
+        self.edges = {}
+        # Edges holding boundary paths of more than one neuron.
+        self.contested = set()
+        coors = [x.origin.coor for x in self.neurons]
+        self.clusters = Clusters([x[0] for x in coors], [x[1] for x in coors])
+
+        for i, neuron in enumerate(self.neurons):
+            neuron.id = i
+            neuron.occupancy = self
+            self.claim(neuron.origin, i)
+            for path in neuron.boundary_paths:
+                self.add_path(path, i)
+
+    def claim(self, node, owner):
+        """Record that neuron number owner occupies node."""
+        site = self.lattice.site(node)
+        if site < 0:
+            owners = self.shared.setdefault(node, [])
+        else:
+            if site >= len(self.owner):
+                self._extend()
+            first = self.owner[site]
+            if first < 0 or first == owner:
+                self.owner[site] = owner
+                return
+            owners = self.shared.setdefault(site, [int(first)])
+
+        if owner not in owners:
+            if owners:
+                self.contacts.append((owners[0], owner))
+            owners.append(owner)
+
+    @staticmethod
+    def edge(path):
+        """Undirected lattice edge a path grows on."""
+        a, b = path.origin, path.dest
+        return (a, b) if a.index < b.index else (b, a)
+
+    def add_path(self, path, owner):
+        """Record a new boundary path of neuron number owner."""
+        edge = self.edge(path)
+        tips = self.edges.get(edge)
+        if tips is None:
+            self.edges[edge] = [(owner, path)]
+            return
+        tips.append((owner, path))
+        if any(x[0] != owner for x in tips):
+            self.contested.add(edge)
+
+    def retire_path(self, path, owner):
+        """Forget a boundary path of neuron number owner."""
+        edge = self.edge(path)
+        tips = self.edges[edge]
+        for i, x in enumerate(tips):
+            if x[1] is path:
+                del tips[i]
+                break
+        if not tips:
+            del self.edges[edge]
+        if edge in self.contested and all(x[0] == tips[0][0] for x in tips):
+            self.contested.discard(edge)
+
+    def owners(self, node):
+        """Numbers of the neurons occupying node."""
+        site = self.lattice.site(node)
+        if site < 0:
+            return self.shared.get(node, [])
+        if site in self.shared:
+            return self.shared[site]
+        if site >= len(self.owner):
+            return []
+        first = self.owner[site]
+        return [int(first)] if first >= 0 else []
+
+    def _extend(self):
+        """Grow owner to the size of a ChunkedLattice that gained chunks."""
+        owner = np.full(max(self.lattice.size, 2 * len(self.owner)), -1,
+                        dtype=np.int32)
+        owner[:len(self.owner)] = self.owner
+        self.owner = owner
+
+    def check_connections(self):
+        """Check connections between neurons.
+        Gives the same result as check_connections(self.neurons, connected)."""
+
+        # Neurons sharing a node.
+        for a, b in self.contacts:
+            self.connect(a, b)
+        del self.contacts[:]
+
+        """
+        Neurons meeting head-on: a boundary path a -> b of one neuron and
+        b -> a of another, with lengths summing to at least max_length. Both
+        paths are on edge (a, b), so only edges holding paths of more than
+        one neuron are checked.
+        """
+        for edge in self.contested:
+            for (a, p1), (b, p2) in combinations(self.edges[edge], 2):
+                if (
+                    p1.origin is p2.dest and \
+                    p1.length + p2.length >= p1.max_length and \
+                    not self.clusters.connected(a, b)
+                    ):
+                    self.connect(a, b)
+
+    def connect(self, a, b):
+        """Connect neurons number a and b."""
+        self.neurons[a].connect()
+        self.neurons[b].connect()
+        self.clusters.union(a, b)
+
+
+class View(object):
+    """Read-only view of one run of an Exp, handed to observers.
+
+    t is the current step, the number of grow() calls. Arrays and
+    iterators are read from the engine as it is, without copies where it
+    keeps arrays, and are only valid until the run goes on.
+    """
+
+    def __init__(self, engine, run, replica=None):
+        """engine - engine of the run.
+        run - number of the run in the experiment.
+        replica - replica of the run in a BatchEngine."""
+        self._engine = engine
+        self._replica = replica
+        self.run = run
+
+    @property
+    def t(self):
+        return self._engine.t
+
+    @property
+    def n(self):
+        """Number of neurons."""
+        return len(self._clusters())
+
+    def _clusters(self):
+        clusters = self._engine.clusters
+        return clusters if self._replica is None else clusters[self._replica]
+
+    def _args(self):
+        return () if self._replica is None else (self._replica,)
+
+    def stats(self):
+        """Clusters.stats()."""
+        return self._clusters().stats()
+
+    def first_contact(self):
+        """Clusters.first_contact, read-only."""
+        view = self._clusters().first_contact.view()
+        view.flags.writeable = False
+        return view
+
+    def growth(self):
+        """The engine's growth()."""
+        growth = self._engine.growth()
+        return growth if self._replica is None else growth[self._replica]
+
+    def tips(self):
+        """Read-only arrays over the tips: origin and dest sites, owner,
+        length, maximum and alive."""
+        return self._engine.tips(*self._args())
+
+    def frontier_sites(self):
+        """(neuron, site) of every site tips grow from."""
+        return self._engine.frontier_sites(*self._args())
+
+    def draw(self, draw, colors):
+        """Draw the neurons on draw, one color per neuron."""
+        if self._replica is None:
+            self._engine.draw(draw, colors)
+        else:
+            self._engine.draw(draw, colors, replica=self._replica)
+
+
+class Observer(object):
+    """Measurement made during the runs of an Exp.
+
+    Exp calls born() once the neurons of a run are born, grown() after
+    grow() and clean() of a step, checked() after check_connections() and
+    finished() at the end of the run, each with a View of the run. grown()
+    and checked() are only called on steps t that are multiples of stride.
+    Subclasses override the calls they need.
+    """
+
+    # Steps between calls of grown() and checked().
+    stride = 1
+
+    def born(self, view):
+        pass
+
+    def grown(self, view):
+        pass
+
+    def checked(self, view):
+        pass
+
+    def finished(self, view):
+        pass
+
+
+class Drawing(Observer):
+    """Draws every step of every run to PNG files trj_<N>_<run>_<t>.png,
+    each neuron in a random color, t counting from 0 as in Exp results.
+    Colors draw from a generator of their own, seeded with seed, so that
+    drawing leaves the draws of the runs alone."""
+
+    def __init__(self, directory, N, size=(2000, 2000), seed=None):
+        self.directory = directory
+        self.N = N
+        self.size = size
+        self.colors = {}
+        self.rng = random.Random(seed)
+
+    def born(self, view):
+        self.colors[view.run] = [
+            tuple([self.rng.randint(0, 255) for i in range(3)] + [100])
+            for x in range(view.n)]
+
+    def grown(self, view):
+        img_name = "{d}/trj_{nn}_{rr}_{tt}.png".format(
+            d=self.directory, nn=self.N, rr=view.run, tt=view.t - 1)
+        img = Image.new('RGBA', self.size, 'white')
+        view.draw(ImageDraw.Draw(img), self.colors[view.run])
+        img.save(img_name, 'PNG')
+
+    def finished(self, view):
+        del self.colors[view.run]
 
 
 class Exp(object):
-    """A simulation of neuron experiment."""
-    pass
+    """A simulation of neuron experiment.
+
+    N_run runs of one pattern type, each grown for T + 1 steps in this
+    process by one of the engines. Parameters come from params, the settings
+    module or any object with its attributes: N_run, T, pn, Local, Nx and Ny
+    for the experiment, Lx and Ly for drawing, and the neuron settings. For
+    the time of run() they are set on the settings module, as if params were
+    settings.py, so that several settings can be run in one process.
+
+    Observers measure what the results leave out while the runs go on. After
+    run(), seconds holds the time spent in the engines ('engine') and in
+    each observer (keyed by the observer).
+    """
+
+    # Engines to grow the neurons with.
+    engines = ('objects', 'arrays', 'events', 'batch', 'tiles')
+
+    def __init__(self, N, params=settings, seed=None, engine='objects',
+                 periodic=False, chunked=False, tiles=None, directory=None,
+                 N_run=None, observers=(), verbose=False):
+        """N - number of edges of the pattern type.
+        params - settings of the experiment.
+        seed - seeds patterns and colors, and growth draws from a
+        BlockRandom stream of seed (one per run with batch). Everything
+        draws from random if None.
+        engine - one of engines.
+        periodic - grow on a periodic lattice spanning the grid.
+        chunked - grow on an unbounded ChunkedLattice.
+        tiles - (ti, tj) tiles for the tiles engine, one strip per CPU if None.
+        directory - draw every step of every run to PNG files there, nothing
+        is drawn if None.
+        N_run - number of runs, params.N_run if None.
+        observers - Observers of the runs.
+        verbose - print progress."""
+        if engine not in self.engines:
+            raise ValueError('Unknown engine: {0}'.format(engine))
+        if chunked and periodic:
+            raise ValueError('A chunked lattice cannot be periodic.')
+        if chunked and engine in ('batch', 'tiles'):
+            raise ValueError(
+                'Engine {0} needs a lattice window, not a chunked lattice.'.format(engine))
+        self.N = N
+        self.params = params
+        self.seed = seed
+        self.engine = engine
+        self.periodic = periodic
+        self.chunked = chunked
+        self.tiles = tiles
+        self.directory = directory
+        self.N_run = params.N_run if N_run is None else N_run
+        self.observers = list(observers)
+        if directory is not None:
+            self.observers.insert(0, Drawing(directory, N, (params.Lx, params.Ly),
+                                             seed=seed))
+        self.verbose = verbose
+        self.seconds = {}
+
+    def run(self):
+        """Run all runs. Return a dict of arrays, first axis the run:
+        fraction, largest, count, spanning - Clusters.stats() after each
+        step, shape (N_run, T + 1).
+        growth - the engine's growth() after each step, shape
+        (N_run, T + 1, 5).
+        first_contact - Clusters.first_contact at the end, shape
+        (N_run, number of neurons, 2)."""
+        self.seconds = dict((x, 0.0) for x in self.observers)
+        self.seconds['engine'] = 0.0
+        saved = self._use_params()
+        rng = Neuron.rng
+        try:
+            if self.seed is not None:
+                random.seed(self.seed)
+            if self.engine == 'batch':
+                runs = self._run_batch()
+            else:
+                # One stream for all runs.
+                self._rng = random if self.seed is None else BlockRandom(self.seed)
+                runs = [self._run_one(r) for r in range(self.N_run)]
+        finally:
+            Neuron.rng = rng
+            self._use_params(saved)
+
+        stats, growth, contacts = zip(*runs)
+        results = {}
+        for k, name in enumerate(('fraction', 'largest', 'count', 'spanning')):
+            results[name] = np.array([[x[k] for x in s] for s in stats])
+        results['growth'] = np.array(growth)
+        results['first_contact'] = np.array(contacts)
+        return results
+
+    def _use_params(self, values=None):
+        """Set values, the settings of params if None, on the settings
+        module, and refresh what is built from them. Return the values they
+        replace."""
+        if values is None:
+            values = dict((x, getattr(self.params, x)) for x in dir(self.params)
+                          if not x.startswith('_') and hasattr(settings, x))
+        return use_settings(values)
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _pattern(self, lattice=None):
+        """Neurons of a new pattern, on lattice if given."""
+        p = self.params
+        if self.chunked:
+            lattice = ChunkedLattice(self.N)
+        if self.N != 6:
+            return pattern42(self.N, p.Nx, p.Ny, p=p.pn, lattice=lattice,
+                             periodic=self.periodic)
+        return pattern6(p.Nx, p.Ny, p=p.pn, lattice=lattice,
+                        periodic=self.periodic)
+
+    def _step(self, *calls):
+        """Call calls, engine steps, timing them."""
+        start = timer()
+        for call in calls:
+            call()
+        self.seconds['engine'] += timer() - start
+
+    def _notify(self, name, views):
+        """Call method name of the observers with each of views, on steps
+        that are multiples of their stride for grown and checked."""
+        t = views[0].t
+        for observer in self.observers:
+            if name in ('grown', 'checked') and t % observer.stride:
+                continue
+            start = timer()
+            for view in views:
+                getattr(observer, name)(view)
+            self.seconds[observer] += timer() - start
+
+    def _engine(self, neurons):
+        """Engine of the neurons of one run."""
+        from engine import ObjectEngine, ArrayEngine, EventEngine
+        from tiles import TiledEngine
+        rng = self._rng
+        local = self.params.Local
+        drawing = self.directory is not None
+        if self.engine == 'objects':
+            Neuron.rng = rng
+            if not drawing:
+                for neuron in neurons:
+                    neuron.completed = None
+            return ObjectEngine(neurons, local=local)
+        if self.engine == 'tiles':
+            # Workers start with the settings of params, applied by run(),
+            # whether they are forked or spawned.
+            return TiledEngine.from_neurons(neurons, local=local,
+                                            tiles=self.tiles, rng=rng)
+        cls = ArrayEngine if self.engine == 'arrays' else EventEngine
+        engine = cls.from_neurons(neurons, local=local, rng=rng)
+        # Completed edges are only needed for drawing.
+        engine.keep_edges = drawing
+        return engine
+
+    def _run_one(self, r):
+        """Run r. Return its statistics, growth and first contacts."""
+        self._log("Generating patterns...")
+        neurons = self._pattern()
+        engine = self._engine(neurons)
+        self._log("Patterns generated.")
+        stats = []
+        growth = []
+        views = [View(engine, r)]
+        try:
+            self._step(engine.born)
+            self._notify('born', views)
+            for t in range(self.params.T + 1):
+                self._log("Timestep: {0}/{1}".format(t, self.params.T))
+                self._step(engine.grow, engine.clean)
+                self._notify('grown', views)
+                self._step(engine.check_connections)
+                self._notify('checked', views)
+                stats.append(engine.clusters.stats())
+                growth.append(engine.growth())
+            self._notify('finished', views)
+        finally:
+            if self.engine == 'tiles':
+                engine.close()
+        return stats, growth, engine.clusters.first_contact
+
+    def _run_batch(self):
+        """All runs at once with a BatchEngine. Return the statistics, growth
+        and first contacts of each run."""
+        from engine import BatchEngine
+        self._log("Generating patterns...")
+        runs = []
+        lattice = None
+        for r in range(self.N_run):
+            neurons = self._pattern(lattice)
+            lattice = neurons[0].lattice
+            runs.append(neurons)
+        rngs = None
+        if self.seed is not None:
+            rngs = [BlockRandom((self.seed, r)) for r in range(self.N_run)]
+        engine = BatchEngine.from_neurons(runs, local=self.params.Local, rngs=rngs)
+        # Completed edges are only needed for drawing.
+        engine.keep_edges = self.directory is not None
+        self._log("Patterns generated.")
+
+        views = [View(engine, r, replica=r) for r in range(self.N_run)]
+        self._step(engine.born)
+        self._notify('born', views)
+        stats = []
+        growth = []
+        for t in range(self.params.T + 1):
+            self._log("Timestep: {0}/{1}".format(t, self.params.T))
+            self._step(engine.grow, engine.clean)
+            self._notify('grown', views)
+            self._step(engine.check_connections)
+            self._notify('checked', views)
+            stats.append(engine.stats())
+            growth.append(engine.growth())
+        self._notify('finished', views)
+        return [([x[r] for x in stats], [x[r] for x in growth], c.first_contact)
+                for r, c in enumerate(engine.clusters)]
 
 ################################
 ########## Exceptions ##########
@@ -449,6 +1585,11 @@ class ErrorHandsNumber(Exception):
     pass
 
 
+class ErrorLatticeEdge(Exception):
+    """A neuron reached the edge of its lattice window."""
+    pass
+
+
 
 ################################
 ########## Functions ###########
@@ -467,9 +1608,8 @@ def check_connections(neurons, connected):
     check between a pair if both elements in the pair are in connected list.
     """
     connected_dict = {x: True for x in connected}
-    pairs = combinations(neurons, 2)
     print("    Generating pairs...")
-    pairs = [x for x in pairs if any([y not in connected for y in x])]
+    pairs = [x for x in close_pairs(neurons) if any([y not in connected for y in x])]
     print("    {n} pairs generated.".format(n=len(pairs)))
 
     for pair in pairs:
@@ -487,7 +1627,8 @@ def check_connections(neurons, connected):
         node_pairs = product(pair[0].nodes, pair[1].nodes)
 
         for n1, n2 in node_pairs:
-            if coor_equal(n1.coor, n2.coor):
+            # Nodes are interned, a shared site is the same object.
+            if n1 is n2:
                 pair[0].connect()
                 pair[1].connect()
                 connectFlag = True
@@ -496,21 +1637,56 @@ def check_connections(neurons, connected):
 
         # Continue check if previous check didnt turn connected to True.
         if not connectFlag:
-            for (p1, p2) in product(pair[0].boundary_paths, pair[1].boundary_paths):
-                """
-                If not connected, then no nodes are common in n1.nodes
-                and n2.nodes. Then p1.origin must be different from
-                p2.orgin.
-                """
-                if (
-                    coor_equal(p1.dest.coor, p2.origin.coor) and \
-                    coor_equal(p2.dest.coor, p1.origin.coor) and \
-                    p1.length + p2.length >= p1.max_length
-                    ):
-                        pair[0].connect()
-                        pair[1].connect()
-                        connectFlag = True
-                        break
+            """
+            If not connected, then no nodes are common in n1.nodes
+            and n2.nodes. Then p1.origin must be different from
+            p2.orgin. Index boundary paths of n2 by edge instead of
+            trying every pair of paths.
+            """
+            heading = {}
+            for p2 in pair[1].boundary_paths:
+                heading.setdefault((p2.origin, p2.dest), []).append(p2)
+            for p1 in pair[0].boundary_paths:
+                if any(p1.length + p2.length >= p1.max_length
+                       for p2 in heading.get((p1.dest, p1.origin), ())):
+                    pair[0].connect()
+                    pair[1].connect()
+                    connectFlag = True
+                    break
+
+def close_pairs(neurons):
+    """Pairs of neurons that may touch: origins at most the sum of their
+    radii apart. Pairs come in the order of combinations(neurons, 2).
+
+    Origins are put in square cells wider than the largest radius doubled,
+    so a neuron is only compared with those in its own and the 8 cells
+    around. Early in a run radii are small and so are the candidates."""
+    # Rounding margin on distances.
+    eps = 1e-6
+    radii = [x.radius for x in neurons]
+    cell = 2 * max(radii) + 1.0
+    cells = {}
+    for i, neuron in enumerate(neurons):
+        x, y = neuron.origin.coor
+        cells.setdefault((int(math.floor(x / cell)), int(math.floor(y / cell))), []).append(i)
+
+    pairs = []
+    for (cx, cy), members in cells.items():
+        others = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                others.extend(cells.get((cx + dx, cy + dy), ()))
+        for i in members:
+            p1 = neurons[i].origin.coor
+            for j in others:
+                if j <= i:
+                    continue
+                p2 = neurons[j].origin.coor
+                if math.hypot(p2[0] - p1[0], p2[1] - p1[1]) <= radii[i] + radii[j] + eps:
+                    pairs.append((i, j))
+    pairs.sort()
+    return [(neurons[i], neurons[j]) for i, j in pairs]
+
 
 def stats_connections(neurons):
     """Stats connected neurons.
@@ -522,64 +1698,144 @@ def stats_connections(neurons):
     return float(count)/len(neurons)
 
 
-def pattern42(N, nx, ny, p=0.3):
-    """Pattern 2 or pattern 4.
-    N - number of edges
-    nx - grid number along x
-    ny - grid number along y
-    p - number of neurons to all grids."""
-
-    grid = []
-    lattice = settings.UNIT_PATH_LENGTH
-
-    n_neurons = int(nx*ny*p)
-
-    for x in range(500, 500 + nx*lattice, lattice):
-        for y in range(500, 500 + ny*lattice, lattice):
-            grid.append((x,y))
-
-    node_coors = random.sample(grid, n_neurons)
-
-    neurons = [Neuron(Node(x, N)) for x in node_coors]
-
-    return neurons
-
-
-def pattern6(nx, ny, p=0.3):
-    """Pattern 6."""
-
-    ny1 = ny / 2
-    ny2 = ny - ny1
-
-    grid = []
-    lattice = settings.UNIT_PATH_LENGTH
-    h = math.sqrt(3)
+def draw_edge(draw, origin, dest, color, f=1.0, lattice=None):
+    """Draw the fraction f of the edge from node origin to node dest next to
+    origin. An edge crossing the edge of a periodic lattice is drawn on both
+    sides."""
+    ends = [(origin, dest)]
+    if lattice is not None:
+        image = lattice.unwrap(origin, dest)
+        if image is not dest:
+            ends = [(origin, image), (lattice.unwrap(dest, origin), dest)]
+    for a, b in ends:
+        p1, p2 = a.coor, b.coor
+        end = (f * p2[0] + (1 - f) * p1[0], f * p2[1] + (1 - f) * p1[1])
+        draw.line([p1, end], fill=color, width=3)
+
+
+def current_settings():
+    """Values of the settings module, by name."""
+    return dict((x, getattr(settings, x)) for x in dir(settings)
+                if not x.startswith('_'))
+
+
+def use_settings(values):
+    """Set values on the settings module, and refresh what is built from
+    them. Return the values they replace."""
+    saved = dict((x, getattr(settings, x)) for x in values)
+    for name, value in values.items():
+        setattr(settings, name, value)
+
+    # engine imports this module.
+    from engine import ArrayEngine
+    Directions._interned.clear()
+    for cls in (Neuron, ArrayEngine):
+        cls.speed = settings.GROW_SPEED
+        cls.split_prob = settings.SPLIT_PROBABILITY
+    return saved
+
+
+def default_reach():
+    """Number of sites a neuron can reach from its origin within settings.T
+    steps, plus the site it is heading to."""
+    return int(settings.GROW_SPEED * (settings.T + 1) / settings.UNIT_PATH_LENGTH) + 2
+
+
+def grid42(nx, ny):
+    """Lattice indices of the nx x ny grid of patterns 2, 3, 4 and 8, as arrays
+    i and j, row by row."""
+    # Grid starts at 500 along x and y, in lattice indices.
+    start = 500 // settings.UNIT_PATH_LENGTH
+    i, j = np.divmod(np.arange(nx * ny), ny)
+    return i + start, j + start
+
+
+def grid6(nx, ny):
+    """Lattice indices of the grid of pattern 6, as arrays i and j.
+    Rows are sqrt(3)/2 apart and shifted by half a lattice unit in turn.
+    Row k holds columns 10 .. 10 + nx - 1, at index (column - k // 2, k)."""
+    ny1 = ny // 2
+    rows = np.concatenate((2 * np.arange(10, 10 + ny1),
+                           2 * np.arange(10, 10 + ny - ny1) + 1))
+    k = np.repeat(rows, nx)
+    column = np.tile(np.arange(10, 10 + nx), len(rows))
+    return column - k // 2, k
+
+
+def choose_origins(n, k, rng=random):
+    """k distinct positions out of range(n), in the order they are drawn.
+    Drawn at once by a NumPy Generator seeded from rng."""
+    generator = np.random.default_rng(rng.getrandbits(64))
+    return generator.choice(n, k, replace=False)
+
+
+def layout42(N, nx, ny, p=0.3, lattice=None, periodic=False, rng=random):
+    """Lattice and origin indices of pattern 2, 3, 4 or 8.
+    Return (lattice, i, j), with the indices of the origins as arrays.
+    See pattern42() for the arguments."""
+    i, j = grid42(nx, ny)
+    if lattice is None:
+        if periodic:
+            lattice = Lattice.torus(N, np.column_stack((i, j)))
+        else:
+            lattice = Lattice.around(N, np.column_stack((i, j)), default_reach())
+    chosen = choose_origins(len(i), int(nx*ny*p), rng)
+    return lattice, i[chosen], j[chosen]
+
+
+def layout6(nx, ny, p=0.3, lattice=None, periodic=False, rng=random):
+    """Lattice and origin indices of pattern 6, as layout42()."""
+    i, k = grid6(nx, ny)
+    if lattice is None:
+        if periodic:
+            lattice = Lattice(6, int(i.min()), int(k.min()), nx,
+                              int(k.max()) + 1 - int(k.min()), periodic=True)
+        else:
+            lattice = Lattice.around(6, np.column_stack((i, k)), default_reach())
+    chosen = choose_origins(len(i), int(nx*ny*p), rng)
+    return lattice, i[chosen], k[chosen]
 
-    n_neurons = int(nx*ny*p)
 
-    for i in range(10, 10 + ny1):
-        y = h*i
-        for j in range(10, 10 + nx):
-            x = j - 0.5
-            grid.append((x*lattice, y*lattice))
+def place_neurons(connections, lattice, i, j):
+    """Neurons with origins at indices (i, j) given as arrays."""
+    if lattice.periodic:
+        # Nodes of the grid in the window.
+        return [Neuron(lattice.node(x), lattice) for x in lattice.sites(i, j).tolist()]
+    return [Neuron(Node(x, connections), lattice)
+            for x in zip(i.tolist(), j.tolist())]
 
-    for i in range(10, 10 + ny2):
-        y = h / 2 + i * h
-        for j in range(10, 10 + nx):
-            x = j
-            grid.append((x*lattice, y*lattice))
 
-    # Draw pattern
-    img = Image.new('RGBA', (2000, 2000), 'white')
+def draw_grid(i, j, connections, file_name, size=(2000, 2000)):
+    """Draw the sites at indices (i, j) to image file_name."""
+    img = Image.new('RGBA', size, 'white')
     draw = ImageDraw.Draw(img)
-    points = [[(x[0], x[1]), (x[0]+5, x[1]+5)] for x in grid]
-    for point in points:
-        draw.ellipse(point, fill='black')
-    img.save('pattern6.png', 'PNG')
+    for index in zip(i.tolist(), j.tolist()):
+        x, y = Node(index, connections).coor
+        draw.ellipse([(x, y), (x + 5, y + 5)], fill='black')
+    img.save(file_name, 'PNG')
 
-    node_coors = random.sample(grid, n_neurons)
-    nodes = [Node(x, 6) for x in node_coors]
 
-    neurons = [Neuron(x) for x in nodes]
-
-    return neurons
+def pattern42(N, nx, ny, p=0.3, lattice=None, periodic=False, rng=random):
+    """Pattern 2, 3, 4 or 8, on a square grid of indices.
+    N - number of edges
+    nx - grid number along x
+    ny - grid number along y
+    p - number of neurons to all grids.
+    lattice - Lattice for the neurons, built around the grid if None.
+    periodic - build a periodic Lattice on the grid instead.
+    rng - seeds the choice of origins, with the interface of random."""
+    lattice, i, j = layout42(N, nx, ny, p, lattice, periodic, rng)
+    return place_neurons(N, lattice, i, j)
+
+
+def pattern6(nx, ny, p=0.3, lattice=None, periodic=False, rng=random, image=None):
+    """Pattern 6.
+    lattice - Lattice for the neurons, built around the grid if None.
+    periodic - build a periodic Lattice on the grid instead. Rows are
+    shifted in index space, so the grid maps onto a torus nx sites around.
+    rng - seeds the choice of origins, with the interface of random.
+    image - file name to draw the grid to, nothing is drawn if None."""
+    if image is not None:
+        draw_grid(*grid6(nx, ny), connections=6, file_name=image)
+    lattice, i, j = layout6(nx, ny, p, lattice, periodic, rng)
+    return place_neurons(6, lattice, i, j)
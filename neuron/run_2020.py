@@ -1,16 +1,14 @@
-import shutil
-import subprocess
 import pandas
 import os.path
 import time
 
+from neuron import Exp
+
 
 def run_one_dim(dim, name=None, num_runs=20):
     ''' Run for one setting '''
-    settings_file_name = 'settings_{}.py'.format(name)
-    data_file_name = '{}/{}_connectivity_result.dat'.format(name, dim)
+    settings = __import__('settings_{}'.format(name))
     out_file_name = 'output/{}_{}_all.csv'.format(name, dim)
-    cmd_run = 'python exp.py {} -d {}'.format(dim, name)
 
     # mkdirs
     work_dir = './{}'.format(name)
@@ -19,30 +17,19 @@ def run_one_dim(dim, name=None, num_runs=20):
     if not os.path.exists('./output'):
         os.mkdir('./output')
 
-    # copy settings
-    shutil.copyfile(settings_file_name, 'settings.py')
+    start = time.time()
+    print('Running {}({}) {} runs'.format(name, dim, num_runs))
+    # All runs in this process, with the settings of name.
+    results = Exp(dim, settings, N_run=num_runs, directory=work_dir).run()
+    end = time.time()
+    print('Running {}({}) {} runs took {:.1f} seconds'.format(name, dim, num_runs, end-start))
 
+    # Connectivity of the previous step, as exp.py writes it.
     df = pandas.DataFrame()
-    for run_id in range(num_runs):
-        start = time.time()
-        print('Running {}({}) {}/{}'.format(name, dim, run_id+1, num_runs))
-        # run exp
-        process = subprocess.Popen(cmd_run.split(), stdout=subprocess.PIPE)
-        output, error = process.communicate()
-
-        # analyze result
-        with open(data_file_name, 'r') as data:
-            lines = data.readlines()
-
-        rows = []
-        for line in lines:
-            if line:
-                time_step, connectivity = line.split()
-                rows.append( [int(time_step), float(connectivity)] )
+    for run_id, fraction in enumerate(results['fraction'].tolist()):
+        rows = [[t, p] for t, p in enumerate([0] + fraction[:-1])]
         df_each_run = pandas.DataFrame(rows, columns=['time run={}'.format(run_id), 'Connectivity run={}'.format(run_id)])
         df[df_each_run.columns] = df_each_run
-        end = time.time()
-        print('Running {}({}) {}/{} took {:.1f} seconds'.format(name, dim, run_id+1, num_runs, end-start))
     df.to_csv(out_file_name)
 
 
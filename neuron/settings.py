@@ -33,6 +33,9 @@ SPLIT_PROBABILITY = 0.1
 # Probabilities of different directions.
 # What matters here is the ratio between each probabilities, because not
 # all ways are available when choosing.
+P3_1 = 0
+P3_2 = 1
+
 P4_1 = 0.2
 P4_2 = 0.8
 
@@ -0,0 +1,69 @@
+'''
+Buffered random streams for the engines.
+
+Engines and neurons draw through an object with the interface of random:
+random(), sample(), randrange() and getrandbits(). BlockRandom gives that
+interface over a numpy.random.Generator, taking uniform variates in blocks
+and handing them out one at a time. Runs are reproducible from the seed; they
+differ from runs drawing from random.
+'''
+from itertools import chain
+
+import numpy as np
+
+
+########## Classes ##########
+
+
+class BlockRandom(object):
+    '''Uniform variates of a numpy Generator, drawn block by block.
+
+    random() reads the next variate of the current block; the next block is
+    drawn when one runs out. Every other draw is built on random(), so that
+    all of them come from the same sequence of variates.
+    '''
+
+    def __init__(self, seed=None, block=4096):
+        '''seed - seed of the Generator, anything numpy.random.default_rng
+        takes.
+        block - number of variates drawn at once.'''
+        self.generator = np.random.default_rng(seed)
+        self.block = block
+        # A chain of lists steps in C: no Python frame per variate.
+        self.random = chain.from_iterable(self._blocks()).__next__
+
+    def _blocks(self):
+        '''Blocks of variates, as lists of floats.'''
+        while True:
+            yield self.generator.random(self.block).tolist()
+
+    def sample(self, population, k):
+        '''k distinct elements of population, in the order they are drawn.'''
+        pool = list(population)
+        n = len(pool)
+        if not 0 <= k <= n:
+            raise ValueError("Sample larger than population or is negative")
+        random = self.random
+        for i in range(k):
+            # Partial Fisher-Yates shuffle.
+            j = i + int(random() * (n - i))
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+    def randrange(self, start, stop=None, step=1):
+        '''Element of range(start, stop, step), uniformly.'''
+        if stop is None:
+            start, stop = 0, start
+        n = len(range(start, stop, step))
+        if not n:
+            raise ValueError("empty range for randrange()")
+        return start + step * int(self.random() * n)
+
+    def getrandbits(self, k):
+        '''Integer of k random bits, from whole 64-bit outputs of the bit
+        generator.'''
+        words = self.generator.bit_generator.random_raw((k + 63) // 64)
+        x = 0
+        for w in words.tolist():
+            x = x << 64 | w
+        return x >> (-k % 64)
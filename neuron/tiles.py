@@ -0,0 +1,418 @@
+'''
+Domain-decomposed runs of one large pattern over several processes.
+
+The lattice window is cut into tiles along its two indices. Each tile is run
+by a worker holding a TileEngine with the neurons whose origin lies in the
+tile; they grow wherever their branches take them. Growing and branching only
+involve a neuron's own sites, so workers advance independently and exchange
+data once per step, in check_connections():
+
+- claims of sites on the boundary of a tile (a site or one of its neighbours
+  in another tile) go to the tiles concerned, so that each tile knows the
+  ownership of its sites and of a halo of one site around them. Contacts on
+  a site are found by the tile holding it only.
+- tips are matched head-on by the tile holding the smaller site of their
+  edge; tips of edges held by another tile are sent there.
+
+Contacts and head-on meetings come back to TiledEngine, which merges them in
+one Clusters for the whole pattern.
+
+Each neuron draws from its own random generator, so that a run does not
+depend on the tiling: for the same generators, any tiling gives the same run
+as a single tile.
+
+Tiles split the work of a step, not the memory: each TileEngine keeps its
+site arrays over the whole lattice window, about 15 bytes per site, and a
+spawned worker its own copy of the Lattice. Memory grows with the number of
+tiles, and tiles only pay off with one worker per free core.
+'''
+import multiprocessing
+import random
+
+import numpy as np
+
+import kernels
+from clusters import Clusters
+from engine import ArrayEngine, tip_arrays
+from neuron import current_settings, draw_edge, use_settings
+
+
+########## Classes ##########
+
+
+class TileEngine(ArrayEngine):
+    '''ArrayEngine for the neurons of one tile.
+
+    Neurons of other tiles met in claims or tips are added as ghosts: local
+    numbers past the tile's own neurons, with no tips or sites of their own.
+    ids holds the number in the whole pattern of every local neuron.
+    '''
+
+    def __init__(self, lattice, origins, ids, seeds, tile_of, tile, local=True):
+        '''lattice - Lattice of the whole pattern.
+        origins - site numbers of the origins of the tile's neurons.
+        ids - numbers of these neurons in the whole pattern.
+        seeds - seeds of their random generators.
+        tile_of - tile of every site.
+        tile - this tile.
+        local - consider local structure when choosing where to go.'''
+        self.ids = list(ids)
+        self._ghosts = {}
+        self.rngs = [random.Random(x) for x in seeds]
+        self.tile_of = tile_of
+        self.tile = tile
+        self._inside = tile_of == tile
+        # Sites whose claims concern other tiles: sites of other tiles, and
+        # sites with a neighbour in another tile.
+        neighbours = tile_of[lattice.indices]
+        border = np.add.reduceat(neighbours != tile, lattice.offsets[:-1]) > 0
+        self._border = border | ~self._inside
+        # Claims other tiles need, since the last exchange.
+        self._outgoing = []
+        super(TileEngine, self).__init__(lattice, origins, local=local, rng=None)
+        self._own_ids = np.array(self.ids, dtype=np.int64)
+
+    def _make_clusters(self):
+        '''Clusters are merged by TiledEngine.'''
+        return None
+
+    def _rng(self, owner):
+        return self.rngs[owner]
+
+    def _ghost(self, neuron):
+        '''Local number of neuron of another tile.'''
+        local = self._ghosts.get(neuron)
+        if local is None:
+            local = self._ghosts[neuron] = len(self.ids)
+            self.ids.append(neuron)
+        return local
+
+    ########## Sites ##########
+
+    def claim(self, site, owner):
+        if self._border[site]:
+            self._outgoing.append((site, owner))
+        super(TileEngine, self).claim(site, owner)
+
+    def _occupy(self, site, owner):
+        '''Contacts on sites of other tiles are left to these tiles.'''
+        contacts = len(self.contacts)
+        super(TileEngine, self)._occupy(site, owner)
+        if not self._inside[site]:
+            del self.contacts[contacts:]
+
+    ########## Exchange ##########
+
+    def outgoing(self):
+        '''Claims and tips other tiles need, as {tile: [(site, neuron)]} and
+        {tile: (origins, destinations, neurons, lengths, maxima)}.'''
+        claims = {}
+        tile_of = self.tile_of
+        for site, owner in self._outgoing:
+            tiles = set(tile_of[self._neighbours(site)].tolist())
+            tiles.add(int(tile_of[site]))
+            tiles.discard(self.tile)
+            for t in tiles:
+                claims.setdefault(t, []).append((site, self.ids[owner]))
+        self._outgoing = []
+
+        tips = {}
+        n = self.n_tips
+        origin = self.tip_origin[:n]
+        dest = self.tip_dest[:n]
+        away = tile_of[np.minimum(origin, dest)]
+        for t in np.unique(away[away != self.tile]).tolist():
+            index = np.flatnonzero(away == t)
+            tips[t] = (origin[index], dest[index],
+                       self._own_ids[self.tip_owner[index]],
+                       self.tip_length[index], self.tip_max[index])
+        return claims, tips
+
+    def meet(self, claims, tips):
+        '''Take claims and tips of other tiles. Return the contacts on the
+        sites of the tile and the pairs of neurons meeting head-on on its
+        edges, as pairs of neuron numbers.'''
+        for site, neuron in claims:
+            self._occupy(site, self._ghost(neuron))
+        ids = self.ids
+        contacts = [(ids[a], ids[b]) for a, b in self.contacts]
+        del self.contacts[:]
+
+        # Tips of the tile's own edges, then tips from other tiles.
+        n = self.n_tips
+        origin = self.tip_origin[:n]
+        dest = self.tip_dest[:n]
+        index = np.flatnonzero(
+            self.tile_of[np.minimum(origin, dest)] == self.tile)
+        parts = [(origin[index], dest[index], self.tip_owner[index],
+                  self.tip_length[index], self.tip_max[index])]
+        for origins, dests, neurons, lengths, maxima in tips:
+            owners = np.array([self._ghost(x) for x in neurons.tolist()],
+                              dtype=np.int32)
+            parts.append((origins, dests, owners, lengths, maxima))
+        origin, dest, owner, length, maximum = [
+            np.concatenate(x) for x in zip(*parts)]
+
+        i, j = kernels.head_on(origin, dest, owner, length, maximum,
+                               len(origin), self.owner, self.is_shared,
+                               self.size)
+        ids = np.array(ids, dtype=np.int64)
+        meetings = list(zip(ids[owner[i]].tolist(), ids[owner[j]].tolist()))
+        return contacts, meetings
+
+    def tips(self):
+        '''ArrayEngine.tips(), with neuron numbers of the pattern.'''
+        tips = super(TileEngine, self).tips()
+        return dict(tips, owner=self._own_ids[tips['owner']])
+
+    def frontier_sites(self):
+        '''ArrayEngine.frontier_sites(), with neuron numbers of the
+        pattern, as a list.'''
+        ids = self.ids
+        return [(ids[owner], site) for owner, site in
+                super(TileEngine, self).frontier_sites()]
+
+    def state(self):
+        '''Completed edges and tips, with neuron numbers of the pattern.'''
+        n = self.n_tips
+        ids = self._own_ids
+        return (np.array(self.edge_origin), np.array(self.edge_dest),
+                ids[np.array(self.edge_owner, dtype=np.int64)],
+                self.tip_origin[:n].copy(), self.tip_dest[:n].copy(),
+                ids[self.tip_owner[:n]], self.tip_length[:n].copy(),
+                self.tip_max[:n].copy())
+
+
+class TiledEngine(object):
+    '''Run of one pattern split in tiles, each in a worker process.
+
+    Same interface as the engines of engine.py. Workers are started with the
+    engine and stopped by close(), by the multiprocessing start method
+    start_method, the default one if None. They get the settings and
+    TileEngine's speed and split probability of this process, so that they
+    run the same physics whether they are forked or spawned.
+    '''
+
+    start_method = None
+
+    def __init__(self, lattice, origins, local=True, tiles=None,
+                 parallel=True, rng=random):
+        '''lattice - Lattice the neurons grow on.
+        origins - site number of each neuron's origin.
+        local - consider local structure when choosing where to go.
+        tiles - (ti, tj) number of tiles along each lattice index. One
+        strip per CPU if None.
+        parallel - run each tile in its own process, or all in this one.
+        rng - draws the seed of each neuron's random generator.'''
+        if tiles is None:
+            tiles = (multiprocessing.cpu_count(), 1)
+        ti, tj = tiles
+        self.lattice = lattice
+        self.tiles = ti * tj
+        self.origins = [int(x) for x in origins]
+        self.n = len(self.origins)
+        self.seeds = [rng.getrandbits(64) for x in self.origins]
+
+        sites = np.arange(lattice.size)
+        i, j = sites // lattice.nj, sites % lattice.nj
+        self.tile_of = (i * ti // lattice.ni) * tj + j * tj // lattice.nj
+
+        coors = [lattice.node(x).coor for x in self.origins]
+        self.clusters = Clusters([x[0] for x in coors], [x[1] for x in coors])
+        self.connected = np.zeros(self.n, dtype=bool)
+        # Current step: number of grow() calls.
+        self.t = 0
+
+        config = (current_settings(), TileEngine.speed, TileEngine.split_prob)
+        context = multiprocessing.get_context(self.start_method)
+        self.workers = []
+        for tile in range(self.tiles):
+            ids = [x for x in range(self.n)
+                   if self.tile_of[self.origins[x]] == tile]
+            args = (lattice, [self.origins[x] for x in ids], ids,
+                    [self.seeds[x] for x in ids], self.tile_of, tile, local)
+            if parallel:
+                self.workers.append(_Worker(args, config, context))
+            else:
+                self.workers.append(_Local(args))
+
+    @classmethod
+    def from_neurons(cls, neurons, local=True, tiles=None, parallel=True,
+                     rng=random):
+        '''Engine for the origins and lattice of unborn Neurons.'''
+        lattice = neurons[0].lattice
+        origins = [lattice.site(x.origin) for x in neurons]
+        return cls(lattice, origins, local=local, tiles=tiles,
+                   parallel=parallel, rng=rng)
+
+    def __len__(self):
+        return self.n
+
+    def _call(self, name, args=None):
+        '''Call method name of every tile, with args[t] for tile t.
+        Return the results, in tile order.'''
+        for t, worker in enumerate(self.workers):
+            worker.send(name, () if args is None else args[t])
+        return [worker.receive() for worker in self.workers]
+
+    def close(self):
+        '''Stop the workers.'''
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+    ########## Steps ##########
+
+    def born(self):
+        self._call('born')
+
+    def grow(self):
+        self.t += 1
+        self._call('grow')
+
+    def clean(self):
+        self._call('clean')
+
+    def check_alive(self):
+        self._call('check_alive')
+
+    def check_connections(self):
+        '''Exchange claims and tips between tiles, then connect the neurons
+        sharing a site or meeting head-on.'''
+        self.clusters.step = self.t
+        claims = [[] for x in self.workers]
+        tips = [[] for x in self.workers]
+        for out_claims, out_tips in self._call('outgoing'):
+            for t, x in out_claims.items():
+                claims[t].extend(x)
+            for t, x in out_tips.items():
+                tips[t].append(x)
+
+        results = self._call('meet', list(zip(claims, tips)))
+        for contacts, meetings in results:
+            for a, b in contacts:
+                self.connect(a, b)
+        # As in ArrayEngine, head-on pairs of one cluster are left alone.
+        for contacts, meetings in results:
+            for a, b in meetings:
+                if not self.clusters.connected(a, b):
+                    self.connect(a, b)
+
+    def connect(self, a, b):
+        '''Connect neurons a and b.'''
+        self.connected[a] = True
+        self.connected[b] = True
+        self.clusters.union(a, b)
+
+    def stats_connections(self):
+        return self.clusters.fraction()
+
+    def growth(self):
+        '''ArrayEngine.growth(), summed over tiles.'''
+        return tuple(sum(x) for x in zip(*self._call('growth')))
+
+    def tips(self):
+        '''ArrayEngine.tips() of all tiles, one after the other.'''
+        tiles = self._call('tips')
+        return tip_arrays([
+            np.concatenate([x[name] for x in tiles]) for name in
+            ('origin', 'dest', 'owner', 'length', 'maximum', 'alive')])
+
+    def frontier_sites(self):
+        '''ArrayEngine.frontier_sites() of all tiles.'''
+        for sites in self._call('frontier_sites'):
+            for x in sites:
+                yield x
+
+    ########## Drawing ##########
+
+    def draw(self, draw, colors):
+        '''Draw origins, completed edges and tips of all neurons.
+        Neurons whose color is None are left out.'''
+        node = self.lattice.node
+        for origin, color in zip(self.origins, colors):
+            if color is None:
+                continue
+            coor = node(origin).coor
+            draw.ellipse([(coor[0] - 5, coor[1] - 5), (coor[0] + 10, coor[1] + 10)], fill=color)
+        for state in self._call('state'):
+            (edge_origin, edge_dest, edge_owner,
+             origin, dest, owner, length, maximum) = [x.tolist() for x in state]
+            for a, b, i in zip(edge_origin, edge_dest, edge_owner):
+                if colors[i] is not None:
+                    draw_edge(draw, node(a), node(b), colors[i], lattice=self.lattice)
+            for a, b, i, f, m in zip(origin, dest, owner, length, maximum):
+                if colors[i] is not None:
+                    draw_edge(draw, node(a), node(b), colors[i], f / m, self.lattice)
+
+
+class _Local(object):
+    '''Tile run in this process.'''
+
+    def __init__(self, args):
+        self.engine = TileEngine(*args)
+
+    def send(self, name, args):
+        try:
+            self.result = (True, getattr(self.engine, name)(*args))
+        except Exception as e:
+            self.result = (False, e)
+
+    def receive(self):
+        ok, result = self.result
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        pass
+
+
+class _Worker(object):
+    '''Tile run in a worker process.'''
+
+    def __init__(self, args, config, context=multiprocessing):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, args, config))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def send(self, name, args):
+        self.conn.send((name, args))
+
+    def receive(self):
+        ok, result = self.conn.recv()
+        if not ok:
+            # Exception type and message, arguments may not pickle.
+            raise result[0](result[1])
+        return result
+
+    def close(self):
+        self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+########## Functions ##########
+
+
+def _serve(conn, args, config):
+    '''Worker process: apply config, settings values and TileEngine's speed
+    and split probability, build the TileEngine of args and call its methods
+    as requested on conn, until None comes.'''
+    values, speed, split_prob = config
+    use_settings(values)
+    TileEngine.speed = speed
+    TileEngine.split_prob = split_prob
+    engine = TileEngine(*args)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        name, args = request
+        try:
+            conn.send((True, getattr(engine, name)(*args)))
+        except Exception as e:
+            conn.send((False, (type(e), str(e))))
+    conn.close()
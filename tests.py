@@ -1,9 +1,22 @@
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 import copy
+import os
+import shutil
+import tempfile
+from itertools import combinations
+import random
 import numpy as np
 
-from neuron import Node, Path, Neuron
-from neuron import coor_equal, check_connections, stats_connections
+from neuron import Node, Path, Neuron, Lattice, Occupancy, Sites, Directions
+from neuron import ChunkedLattice, NEIGHBOUR_OFFSETS
+from neuron import coor_equal, check_connections, stats_connections, close_pairs
+from neuron import pattern42, pattern6, grid42, grid6, layout42, Exp, Observer
+from neuron import use_settings
+from clusters import Clusters
+from engine import ObjectEngine, ArrayEngine, EventEngine, BatchEngine
+import kernels
+from tiles import TiledEngine
+from streams import BlockRandom
 
 import settings
 
@@ -19,7 +32,7 @@ class TestNode(TestCase):
 
     def setUp(self):
         self.coor = (0, 0)
-        self.max_length = settings.MAX_PATH_LENGTH
+        self.max_length = settings.UNIT_PATH_LENGTH
 
     def test_equal(self):
         '''Test for equal operator overloading in Node.'''
@@ -29,10 +42,27 @@ class TestNode(TestCase):
         self.node4 = Node((1, 1), 2)
 
         self.assertEqual(self.node1, self.node2)
+        # Nodes are interned.
+        self.assertTrue(self.node1 is self.node2)
         self.assertNotEqual(self.node1, self.node3)
         self.assertNotEqual(self.node1, self.node4)
         self.assertNotEqual(self.node3, self.node4)
 
+    def test_released(self):
+        '''Interned nodes go away once nothing holds them.'''
+        neurons = pattern42(4, 6, 6)
+        for neuron in neurons:
+            neuron.born()
+        held = len(Node._interned)
+        self.assertTrue(held > 0)
+        del neurons, neuron
+        self.assertTrue(len(Node._interned) < held)
+        key = (12345, 0, 4)
+        node = Node(key[:2], 4)
+        self.assertTrue(Node(key[:2], 4) is node)
+        del node
+        self.assertFalse(key in Node._interned)
+
     def test_node_2(self):
         '''Test for neighbour coordinates of node with 2 connections.'''
         self.node = Node(self.coor, 2)
@@ -61,10 +91,167 @@ class TestNode(TestCase):
         pass
 
 
+class TestLattice(TestCase):
+
+    def test_neighbours(self):
+        '''Neighbour table agrees with Node.neighbours for every type.'''
+        for n in (2, 3, 4, 6, 8):
+            lattice = Lattice(n, -3, -2, 7, 5)
+            self.assertEqual(lattice.size, 35)
+            for site in range(lattice.size):
+                node = lattice.node(site)
+                self.assertEqual(lattice.site(node), site)
+                self.assertEqual(list(lattice.neighbours(node)), node.neighbours)
+
+    def test_table(self):
+        '''Sites on the edge of the window have fewer table entries.'''
+        lattice = Lattice(4, 0, 0, 3, 3)
+        corner = lattice.site(Node((0, 0), 4))
+        centre = lattice.site(Node((1, 1), 4))
+        self.assertEqual(len(lattice.neighbour_sites(corner)), 2)
+        self.assertEqual(len(lattice.neighbour_sites(centre)), 4)
+        self.assertEqual(
+            [lattice.node(x) for x in lattice.neighbour_sites(centre)],
+            Node((1, 1), 4).neighbours)
+        self.assertEqual(list(lattice.directions[lattice.offsets[centre]:lattice.offsets[centre + 1]]),
+                         [0, 1, 2, 3])
+        # Nodes outside the window.
+        self.assertEqual(lattice.site(Node((5, 5), 4)), -1)
+        self.assertEqual(list(lattice.neighbours(Node((5, 5), 4))), Node((5, 5), 4).neighbours)
+
+
+    def test_periodic(self):
+        '''Indices wrap around a periodic window.'''
+        for n in (2, 4, 6, 8):
+            lattice = Lattice(n, 2, 3, 4, 5, periodic=True)
+            for site in range(lattice.size):
+                node = lattice.node(site)
+                sites, directions = lattice.row(site)
+                self.assertEqual(directions, list(range(n)))
+                for k, x in zip(directions, sites):
+                    step = NEIGHBOUR_OFFSETS[n][k]
+                    image = Node((node.index[0] + step[0], node.index[1] + step[1]), n)
+                    self.assertEqual(lattice.site(image), x)
+                    self.assertEqual(lattice.direction(node, lattice.node(x)), k)
+                    self.assertTrue(lattice.unwrap(node, lattice.node(x)) is image)
+        self.assertRaises(ValueError, Lattice, 4, 0, 0, 2, 5, True)
+
+    def test_chunked(self):
+        '''Chunks are numbered on first touch, anywhere on the lattice.'''
+        for n in (2, 4, 6, 8):
+            lattice = ChunkedLattice(n, side=4)
+            self.assertEqual(lattice.size, 0)
+            for index in ((0, 0), (-5, 3), (1000, -1000), (3, 3)):
+                node = Node(index, n)
+                site = lattice.site(node)
+                self.assertEqual(lattice.node(site), node)
+                sites, directions = lattice.row(site)
+                self.assertEqual([lattice.node(x) for x in sites], node.neighbours)
+                self.assertEqual(directions, list(range(n)))
+            # Touched chunks and their neighbours only.
+            self.assertEqual(lattice.size % 16, 0)
+            self.assertTrue(lattice.size <= 3 * 9 * 16)
+
+
+class TestDirections(TestCase):
+
+    def test_lengths(self):
+        '''Edge lengths agree with node coordinates.'''
+        for n in (2, 4, 6, 8):
+            table = Directions(n)
+            self.assertIs(table, Directions(n))
+            origin = Node((2, -1), n)
+            for k, node in enumerate(origin.neighbours):
+                self.assertEqual(table.direction(origin, node), k)
+                a = np.array(node.coor) - np.array(origin.coor)
+                self.assertAlmostEqual(table.length(origin, node), np.linalg.norm(a))
+                self.assertAlmostEqual(Path(origin, node).max_length, np.linalg.norm(a))
+
+    def test_weights(self):
+        '''Weights follow the cases of local structure.'''
+        table = Directions(4)
+        # Arriving along +x.
+        self.assertEqual(table.weights[0], [settings.P4_2, settings.P4_2, settings.P4_1, settings.P4_1])
+        table = Directions(6)
+        # Arriving along +x: straight on, back, and two 60 degrees turns each way.
+        self.assertEqual(table.weights[0][0], settings.P6_3)
+        self.assertEqual(table.weights[0][1], settings.P6_1)
+        self.assertEqual(table.weights[0][3], settings.P6_2)
+
+    def test_honeycomb(self):
+        '''Honeycomb edges all have the same length, and sites alternate
+        between sublattices.'''
+        table = Directions(3)
+        for i, j in [(0, 0), (1, 0), (3, -2), (-1, 4)]:
+            node = Node((i, j), 3)
+            self.assertEqual(len(node.neighbours), 3)
+            for neighbour in node.neighbours:
+                self.assertTrue(node in neighbour.neighbours)
+                self.assertNotEqual(table.sublattice(*neighbour.index),
+                                    table.sublattice(i, j))
+                a = np.array(neighbour.coor) - np.array(node.coor)
+                self.assertAlmostEqual(np.linalg.norm(a), settings.UNIT_PATH_LENGTH)
+        # Going back is never chosen.
+        k_in = table.direction(Node((0, 0), 3), Node((1, 0), 3))
+        back = table.direction(Node((1, 0), 3), Node((0, 0), 3))
+        self.assertEqual(table.weights[k_in][back], settings.P3_1)
+        self.assertRaises(ValueError, Lattice, 3, 0, 0, 5, 6, True)
+
+    def test_sample(self):
+        '''Weighted draws without replacement.'''
+        table = Directions(4)
+        random.seed(1)
+        for i in range(50):
+            chosen = table.sample(0, [0, 2, 3], 2)
+            self.assertEqual(len(set(chosen)), 2)
+            self.assertTrue(set(chosen) <= set([0, 2, 3]))
+        self.assertEqual(sorted(table.sample(0, [2, 3], 3)), [2, 3])
+        self.assertEqual(table.sample(0, [], 1), [])
+
+
+class TestSites(TestCase):
+    '''Membership in Sites follows list changes.'''
+
+    def test_membership(self):
+        a, b, c = Node((0, 0), 4), Node((1, 0), 4), Node((2, 0), 4)
+        sites = Sites([a, b])
+        sites.append(b)
+        self.assertEqual(sites, [a, b, b])
+        self.assertTrue(b in sites)
+        self.assertFalse(c in sites)
+        del sites[sites.index(b)]
+        self.assertTrue(b in sites)
+        sites.remove(b)
+        self.assertFalse(b in sites)
+        sites[0] = c
+        self.assertFalse(a in sites)
+        self.assertTrue(c in sites)
+        copied = copy.deepcopy(sites)
+        self.assertEqual(copied, [c])
+        copied.pop()
+        self.assertFalse(c in copied)
+
+    def test_all_changes(self):
+        '''No change to the list leaves membership stale.'''
+        a, b, c = Node((0, 0), 4), Node((1, 0), 4), Node((2, 0), 4)
+        sites = Sites([a, b, c])
+        sites[1:] = (x for x in [c])
+        self.assertEqual(sites, [a, c])
+        self.assertFalse(b in sites)
+        sites[::2] = [b]
+        self.assertEqual(sites, [b, c])
+        self.assertFalse(a in sites)
+        sites.reverse()
+        self.assertEqual(sites, [c, b])
+        self.assertTrue(b in sites)
+        sites.clear()
+        self.assertFalse(b in sites or c in sites)
+
+
 class TestPath(TestCase):
 
     def setUp(self):
-        self.max_length = settings.MAX_PATH_LENGTH
+        self.max_length = settings.UNIT_PATH_LENGTH
         # Initiate origin/destination node.
         origin_coor = (0, 0)
         dest_coor = (self.max_length, 0)
@@ -85,7 +272,7 @@ class TestPath(TestCase):
 class TestNeuron(TestCase):
 
     def setUp(self):
-        self.max_length = settings.MAX_PATH_LENGTH
+        self.max_length = settings.UNIT_PATH_LENGTH
         self.origin_coor = (0, 0)
         self.origin_node = Node(self.origin_coor, 4)
         self.neuron = Neuron(self.origin_node)
@@ -106,12 +293,14 @@ class TestNeuron(TestCase):
         node6 = Node(self.origin_coor, 6)
         neuron6 = Neuron(node6)
         hands = []
-        '''The probability that neuron.hands only give 2 unique values in
-        40 calls is less than 0.00000001'''
-        for i in range(40):
+        '''The probability that neuron.hands misses one of the values from
+        Hands_low to Hands_high in 400 calls is below 1e-20 for the 8
+        values of the settings file'''
+        for i in range(400):
             hands.append(neuron6.hands)
         hands = set(hands)
-        self.assertEqual(hands, set([4, 5, 6]))
+        self.assertEqual(hands, set(range(settings.Hands_low,
+                                          settings.Hands_high + 1)))
 
     def test_born(self):
         '''Test for born method of neuron.
@@ -158,9 +347,9 @@ class TestNeuron(TestCase):
         test = (-1, 0)
         # Assign nodes to self.neuron
         for x in node_coors:
-            node = Node([y*self.max_length for y in x], 4)
+            node = Node(x, 4)
             self.neuron.nodes.append(node)
-        test_node = Node([y*self.max_length for y in test], 4)
+        test_node = Node(test, 4)
         # Assert no way available.
         self.assertFalse(self.neuron.way_to_go(test_node, True))
 
@@ -173,11 +362,11 @@ class TestNeuron(TestCase):
         test = (-1, 0)
         # Assign nodes to self.neuron
         for x in node_coors:
-            node = Node([y*self.max_length for y in x], 4)
+            node = Node(x, 4)
             self.neuron.nodes.append(node)
-        test_node = Node([y*self.max_length for y in test], 4)
+        test_node = Node(test, 4)
         # Assert only one way, the only way is (-1, 1)
-        target = Node([y*self.max_length for y in (-1, 1)], 4)
+        target = Node((-1, 1), 4)
         self.assertEqual(self.neuron.way_to_go(test_node, True), [target])
 
     def test_clean(self):
@@ -185,11 +374,13 @@ class TestNeuron(TestCase):
 
         self.neuron.born()
         # Grow to exceed max_length.
-        steps = int(self.max_length)/5 + 1
+        steps = int(self.max_length / Neuron.speed) + 1
         for i in range(steps):
             self.neuron.grow()
         # Check that all boundary_paths has the expected length.
-        self.assertTrue(all([x.length == steps*Neuron.speed for x in self.neuron.boundary_paths]))
+        for x in self.neuron.boundary_paths:
+            self.assertAlmostEqual(x.length, steps * Neuron.speed)
+            self.assertTrue(x.length > x.max_length)
 
         pre_boundary_nodes = copy.deepcopy(self.neuron.boundary_nodes)
         pre_boundary_paths = copy.deepcopy(self.neuron.boundary_paths)
@@ -203,6 +394,63 @@ class TestNeuron(TestCase):
         # All paths in previous boundary paths are not in boundary paths any more.
         self.assertTrue(all([x not in self.neuron.boundary_paths for x in pre_boundary_paths]))
 
+    def test_check_alive(self):
+        '''Paths die once all neighbours of their origin are occupied.'''
+
+        self.neuron.born()
+        self.neuron.check_alive()
+        self.assertTrue(all([x.alive for x in self.neuron.boundary_paths]))
+        neighbours = self.origin_node.neighbours
+        for node in neighbours[:-1]:
+            self.neuron._reach(node)
+        self.neuron.check_alive()
+        self.assertTrue(all([x.alive for x in self.neuron.boundary_paths]))
+        self.assertEqual(self.neuron.free[self.origin_node], 1)
+
+        self.neuron._reach(neighbours[-1])
+        self.neuron.check_alive()
+        self.assertFalse(any([x.alive for x in self.neuron.boundary_paths]))
+        self.assertEqual(self.neuron.growing, [])
+        lengths = [x.length for x in self.neuron.boundary_paths]
+        self.neuron.grow()
+        self.assertEqual([x.length for x in self.neuron.boundary_paths], lengths)
+
+    def test_clean_overshoot(self):
+        '''A path several nodes past its destination is resolved in one clean.'''
+
+        random.seed(0)
+        self.neuron.born()
+        for path in self.neuron.boundary_paths:
+            path.length = 3.5 * self.max_length
+        self.neuron.clean()
+
+        # Every hand completed three paths and is half way along the next.
+        self.assertTrue(all([x.length <= x.max_length for x in self.neuron.boundary_paths]))
+        self.assertTrue(all([x.length == x.max_length for x in self.neuron.paths]))
+        self.assertTrue(len(self.neuron.paths) >= 3 * self.neuron.hands)
+        self.assertEqual(len(self.neuron.nodes), 1 + len(self.neuron.paths))
+        self.assertEqual(set(self.neuron.boundary_nodes),
+                         set([x.dest for x in self.neuron.boundary_paths]))
+
+    def test_completed(self):
+        '''Completed paths kept as Paths, as site numbers, or not at all.'''
+        lattice = Lattice.around(4, [self.origin_node.index], 10)
+        edges = {}
+        for completed in ('paths', 'sites', None):
+            random.seed(0)
+            neuron = Neuron(self.origin_node, lattice)
+            neuron.completed = completed
+            neuron.born()
+            for t in range(100):
+                neuron.grow()
+                neuron.clean()
+                neuron.check_alive()
+            edges[completed] = list(neuron.completed_edges())
+        self.assertTrue(edges['paths'])
+        self.assertEqual(edges['sites'], edges['paths'])
+        self.assertEqual(edges[None], [])
+        self.assertFalse(hasattr(self.origin_node, '__dict__'))
+
 
 class TestCheckConnections(TestCase):
     '''Tests for check_connections() function.'''
@@ -210,7 +458,7 @@ class TestCheckConnections(TestCase):
     def setUp(self):
 
         c0 = (0, 0)
-        c1 = (0, 50)
+        c1 = (0, 1)
         node0 = Node(c0, 4)
         node1 = Node(c1, 4)
 
@@ -255,6 +503,550 @@ class TestCheckConnections(TestCase):
         self.assertFalse(self.n2.connected)
 
 
+class TestClosePairs(TestCase):
+
+    def test_close_pairs(self):
+        # Pairs left out share no node, occupied or heading to.
+        random.seed(3)
+        neurons = pattern42(4, 10, 10)
+        for neuron in neurons:
+            neuron.born()
+        for t in range(40):
+            for neuron in neurons:
+                neuron.grow()
+                neuron.clean()
+            # Radii kept as nodes come bound every node.
+            for neuron in neurons:
+                x0, y0 = neuron.origin.coor
+                far = max(np.hypot(x.coor[0] - x0, x.coor[1] - y0) for x in
+                          list(neuron.nodes) + list(neuron.boundary_nodes))
+                self.assertTrue(far <= neuron.radius + 1e-9)
+            close = close_pairs(neurons)
+            if t == 0:
+                self.assertTrue(len(close) < len(neurons) * (len(neurons) - 1) // 4)
+            close = set(close)
+            for a, b in combinations(neurons, 2):
+                if (a, b) not in close:
+                    sites = set(a.nodes) | set(a.boundary_nodes)
+                    self.assertFalse(sites & (set(b.nodes) | set(b.boundary_nodes)))
+
+class TestOccupancy(TestCheckConnections):
+    '''Tests for Occupancy.check_connections(), on the same neurons.'''
+
+    def setUp(self):
+        super(TestOccupancy, self).setUp()
+        self.lattice = Lattice(4, -2, -2, 5, 5)
+
+    def test_no_connections_at_init(self):
+        Occupancy(self.neurons, self.lattice)
+        self.assertEqual(stats_connections(self.neurons), 0)
+
+    def test_common_nodes(self):
+        occupancy = Occupancy([self.n1, self.n2], self.lattice)
+        self.assertEqual(occupancy.owners(self.n1.origin), [0, 1])
+        occupancy.check_connections()
+        self.assertTrue(self.n1.connected and self.n2.connected)
+
+    def test_common_path_sum_exceeds(self):
+        Occupancy([self.n0, self.n1], self.lattice).check_connections()
+        self.assertTrue(self.n0.connected and self.n1.connected)
+
+    def test_common_path_sum_not_enough(self):
+        Occupancy([self.n0, self.n2], self.lattice).check_connections()
+        self.assertFalse(self.n0.connected)
+        self.assertFalse(self.n2.connected)
+
+    def test_edges(self):
+        '''Boundary paths are indexed by undirected edge.'''
+        occupancy = Occupancy([self.n0, self.n1], self.lattice)
+        edge = Occupancy.edge(self.n0.boundary_paths[0])
+        self.assertEqual(edge, Occupancy.edge(self.n1.boundary_paths[0]))
+        self.assertEqual(occupancy.contested, set([edge]))
+        occupancy.retire_path(self.n1.boundary_paths[0], 1)
+        self.assertEqual(occupancy.contested, set())
+        self.assertEqual(len(occupancy.edges[edge]), 1)
+        occupancy.check_connections()
+        self.assertFalse(self.n0.connected)
+
+    def test_same_as_check_connections(self):
+        '''Same connectivity curve as check_connections() over a run.'''
+        curves = []
+        for use_occupancy in (False, True):
+            random.seed(3)
+            neurons = pattern42(4, 8, 6, p=0.3)
+            occupancy = Occupancy(neurons)
+            for neuron in neurons:
+                neuron.born()
+            curve = []
+            for t in range(70):
+                for neuron in neurons:
+                    neuron.grow()
+                    neuron.clean()
+                if use_occupancy:
+                    occupancy.check_connections()
+                else:
+                    connected = [x for x in neurons if x.connected]
+                    check_connections(neurons, connected)
+                curve.append(stats_connections(neurons))
+                if use_occupancy:
+                    self.assertEqual(occupancy.clusters.fraction(), curve[-1])
+            curves.append(curve)
+        self.assertEqual(curves[0], curves[1])
+        self.assertTrue(curves[1][-1] > 0)
+
+
+class TestClusters(TestCase):
+    '''Tests for the union-find cluster tracker.'''
+
+    def setUp(self):
+        # Five neurons on a row, one above the middle.
+        self.clusters = Clusters([0, 1, 2, 3, 2], [0, 0, 0, 0, 1])
+
+    def test_init(self):
+        self.assertEqual(self.clusters.stats(), (0.0, 1, 5, False))
+
+    def test_union(self):
+        self.assertTrue(self.clusters.union(0, 1))
+        self.assertTrue(self.clusters.union(2, 4))
+        self.assertFalse(self.clusters.union(1, 0))
+        self.assertTrue(self.clusters.connected(4, 2))
+        self.assertFalse(self.clusters.connected(0, 2))
+        self.assertEqual(self.clusters.stats(), (0.8, 2, 3, True))
+        self.assertTrue(self.clusters.spanning_y)
+        self.assertFalse(self.clusters.spanning_x)
+
+    def test_spanning(self):
+        self.clusters.union(0, 1)
+        self.clusters.union(2, 3)
+        self.assertFalse(self.clusters.spanning)
+        self.clusters.union(1, 2)
+        self.assertTrue(self.clusters.spanning_x)
+        self.assertEqual(self.clusters.stats(), (0.8, 4, 2, True))
+
+    def test_first_contact(self):
+        self.clusters.step = 2
+        self.clusters.union(0, 1)
+        self.clusters.step = 5
+        self.clusters.union(1, 2)
+        self.clusters.union(2, 0)
+        self.assertEqual(self.clusters.first_contact.tolist(),
+                         [[2, 1], [2, 0], [5, 1], [-1, -1], [-1, -1]])
+        self.assertEqual(self.clusters.connectivity(7).tolist(),
+                         [0, 0, 0.4, 0.4, 0.4, 0.6, 0.6])
+
+
+class TestEngines(TestCase):
+    '''ArrayEngine and EventEngine must reproduce ObjectEngine for the same
+    random state.'''
+
+    def run_engine(self, make, N, local, steps=80, side=6, stats=None,
+                   **options):
+        '''Run make(neurons, local) on a pattern42 of side x side, options
+        going to pattern42. See run_steps().'''
+        random.seed(7)
+        engine = self.engine = make(pattern42(N, side, side, **options), local)
+        return self.run_steps(engine, steps, stats)
+
+    def run_steps(self, engine, steps=80, stats=None):
+        '''Run engine, return stats(engine) of each step, the stats of its
+        clusters by default.'''
+        engine.born()
+        result = []
+        for t in range(steps):
+            engine.grow()
+            engine.clean()
+            engine.check_alive()
+            engine.check_connections()
+            result.append(engine.clusters.stats() if stats is None
+                          else stats(engine))
+        return result
+
+    def compare(self, N, local):
+        expected = self.run_engine(ObjectEngine, N, local)
+        for engine in (ArrayEngine, EventEngine):
+            result = self.run_engine(engine.from_neurons, N, local)
+            self.assertEqual(result, expected)
+
+    def test_first_contact(self):
+        '''Engines date first contacts alike, and the connectivity curve
+        follows from them.'''
+        steps = []
+        for make in (ObjectEngine, ArrayEngine.from_neurons, EventEngine.from_neurons):
+            stats = self.run_engine(make, 4, True)
+            engine = self.engine
+            curve = engine.clusters.connectivity(len(stats) + 1)
+            self.assertEqual(curve[1:].tolist(), [x[0] for x in stats])
+            steps.append(engine.clusters.first_contact[:, 0].tolist())
+        self.assertEqual(steps[1], steps[0])
+        self.assertEqual(steps[2], steps[0])
+
+    def test_growth(self):
+        '''Growth counters match the tips and edges of the run, and engines
+        count alike.'''
+        self.run_engine(ArrayEngine.from_neurons, 4, True)
+        engine = self.engine
+        n = engine.n_tips
+        live, dead, length, edges, splits = engine.growth()
+        self.assertEqual(live, engine.tip_alive[:n].sum())
+        self.assertEqual(edges, len(engine.edge_origin))
+        self.assertAlmostEqual(
+            length, engine.tip_length[:n].sum() + edges * engine._max[0])
+
+        self.run_engine(EventEngine.from_neurons, 4, True)
+        result = self.engine.growth()
+        self.assertEqual(result[:2] + result[3:], (live, dead, edges, splits))
+        self.assertAlmostEqual(result[2], length)
+
+    def test_growth_series(self):
+        '''Neurons count their growth as the array engines do, step by
+        step, up to tips dying on a full torus.'''
+        def run(make, local):
+            return self.run_engine(make, 4, local, steps=300, side=5,
+                                   stats=lambda engine: engine.growth(),
+                                   periodic=True)
+
+        for local in (True, False):
+            expected = run(ObjectEngine, local)
+            self.assertTrue(expected[-1][1] > 0 and expected[-1][4] > 0)
+            result = run(ArrayEngine.from_neurons, local)
+            for a, b in zip(result, expected):
+                self.assertEqual(a[:2] + a[3:], b[:2] + b[3:])
+                self.assertAlmostEqual(a[2], b[2])
+
+    def test_square(self):
+        self.compare(4, True)
+        self.compare(4, False)
+
+    def test_batch(self):
+        '''Each replica of a BatchEngine is the run of an ArrayEngine with
+        the same generator.'''
+        random.seed(7)
+        lattice = pattern42(4, 6, 6)[0].lattice
+        runs = [pattern42(4, 6, 6, lattice=lattice) for r in range(3)]
+        expected = [
+            self.run_steps(ArrayEngine.from_neurons(neurons, True,
+                                                    rng=random.Random(r)))
+            for r, neurons in enumerate(runs)]
+
+        engine = BatchEngine.from_neurons(runs, True,
+                                          rngs=[random.Random(r) for r in range(3)])
+        result = self.run_steps(engine, stats=BatchEngine.stats)
+        self.assertEqual([list(x) for x in zip(*result)], expected)
+        self.assertEqual(len(engine.stats_connections()), 3)
+
+    def test_events(self):
+        '''Steps without events leave EventEngine untouched.'''
+        random.seed(7)
+        engine = EventEngine.from_neurons(pattern42(4, 6, 6), True)
+        engine.born()
+        first = min(engine.tip_arrival)
+        self.assertTrue(first > 1)
+        for t in range(first - 1):
+            engine.grow()
+            engine.clean()
+        self.assertEqual(engine.n_tips, 4 * len(engine))
+        engine.grow()
+        engine.clean()
+        self.assertTrue(engine.n_tips > 4 * len(engine))
+
+    def test_eight(self):
+        self.compare(8, True)
+
+    def test_honeycomb(self):
+        self.compare(3, True)
+        self.compare(3, False)
+
+    def test_block_random(self):
+        '''Engines drawing from BlockRandom streams of one seed agree.'''
+        def make_objects(neurons, local):
+            Neuron.rng = BlockRandom(3, block=64)
+            return ObjectEngine(neurons, local)
+        def make_arrays(neurons, local):
+            return ArrayEngine.from_neurons(neurons, local,
+                                            rng=BlockRandom(3, block=64))
+        try:
+            for local in (True, False):
+                expected = self.run_engine(make_objects, 8, local)
+                self.assertEqual(self.run_engine(make_arrays, 8, local), expected)
+        finally:
+            Neuron.rng = random
+
+        rng = BlockRandom(5, block=16)
+        draws = [rng.random() for x in range(40)]
+        self.assertEqual(draws, BlockRandom(5, block=7).generator.random(40).tolist())
+        self.assertEqual(sorted(rng.sample(range(6), 6)), list(range(6)))
+        self.assertTrue(all(rng.randrange(1, 9, 2) in (1, 3, 5, 7) for x in range(50)))
+        self.assertTrue(0 <= rng.getrandbits(70) < 2 ** 70)
+
+    def test_chunked(self):
+        '''A ChunkedLattice gives the same run as a Lattice window.'''
+        for make in (ObjectEngine, ArrayEngine.from_neurons):
+            self.assertEqual(
+                self.run_engine(make, 4, False,
+                                lattice=ChunkedLattice(4, side=8)),
+                self.run_engine(make, 4, False))
+
+    def test_periodic(self):
+        '''Neurons keep growing around a torus, in the same run with
+        either engine.'''
+        def run(make):
+            return self.run_engine(make, 4, True, steps=300, side=5,
+                                   periodic=True)
+
+        expected = run(ObjectEngine)
+        self.assertEqual(run(ArrayEngine.from_neurons), expected)
+        self.assertEqual(expected[-1][0], 1.0)
+
+    def test_tiles(self):
+        '''Any tiling of a TiledEngine gives the run of a single tile.'''
+        def run(tiles, parallel):
+            def make(neurons, local):
+                return TiledEngine.from_neurons(neurons, local, tiles=tiles,
+                                                parallel=parallel)
+            stats = self.run_engine(make, 4, False, steps=60, side=8)
+            self.engine.close()
+            return stats
+
+        expected = run((1, 1), False)
+        self.assertEqual(run((3, 2), False), expected)
+        self.assertEqual(run((2, 2), True), expected)
+
+    def test_tiles_spawn(self):
+        '''Spawned workers run with the settings of this process, not the
+        ones of the settings module they import.'''
+        def run(tiles, parallel):
+            def make(neurons, local):
+                return TiledEngine.from_neurons(neurons, local, tiles=tiles,
+                                                parallel=parallel)
+            stats = self.run_engine(make, 4, False, steps=40, side=8)
+            self.engine.close()
+            return stats
+
+        default = run((1, 1), False)
+        saved = use_settings({'GROW_SPEED': 2.9, 'SPLIT_PROBABILITY': 0.4,
+                              'P4_1': 0.5, 'P4_2': 0.5})
+        TiledEngine.start_method = 'spawn'
+        try:
+            expected = run((1, 1), False)
+            self.assertEqual(run((2, 1), True), expected)
+        finally:
+            TiledEngine.start_method = None
+            use_settings(saved)
+        self.assertNotEqual(expected, default)
+
+
+class TestKernels(TestCase):
+    '''Loop versions of the kernels, and the compiled ones with Numba,
+    agree with the NumPy versions.'''
+
+    def compare(self, grow, overshoots, head_on):
+        '''Compare kernels with the NumPy versions along a run.'''
+        random.seed(7)
+        engine = ArrayEngine.from_neurons(pattern42(4, 6, 6), False)
+        engine.born()
+        met = 0
+        for t in range(80):
+            length = engine.tip_length.copy()
+            kernels.grow_numpy(length, engine.tip_alive, engine.n_tips, 0.7)
+            grow(engine.tip_length, engine.tip_alive, engine.n_tips, 0.7)
+            self.assertTrue((length == engine.tip_length).all())
+            args = (engine.tip_length, engine.tip_max, engine.n_tips)
+            self.assertEqual(overshoots(*args).tolist(),
+                             kernels.overshoots_numpy(*args).tolist())
+            engine.clean()
+            engine.check_alive()
+            args = (engine.tip_origin, engine.tip_dest, engine.tip_owner,
+                    engine.tip_length, engine.tip_max, engine.n_tips,
+                    engine.owner, engine.is_shared, engine.size)
+            i, j = head_on(*args)
+            expected_i, expected_j = kernels.head_on_numpy(*args)
+            self.assertEqual(i.tolist(), expected_i.tolist())
+            self.assertEqual(j.tolist(), expected_j.tolist())
+            met += len(i)
+            engine.check_connections()
+        self.assertTrue(met > 0)
+
+    def test_loop(self):
+        self.compare(kernels.grow_loop, kernels.overshoots_loop,
+                     kernels.head_on_loop)
+
+    @skipUnless(kernels.numba, 'Numba is not installed')
+    def test_numba(self):
+        self.compare(kernels.grow, kernels.overshoots, kernels.head_on)
+
+    def test_edge_cases(self):
+        '''No tips, a single candidate, candidates not facing each other,
+        and tips facing each other short of meeting.'''
+        # Sites 0 and 1 owned by neurons 0 and 1, site 2 free.
+        first = np.array([0, 1, -1], dtype=np.int32)
+        is_shared = np.zeros(3, dtype=bool)
+        maximum = np.ones(2)
+        alive = np.array([True, False])
+        for version in ('loop', 'numpy'):
+            grow = getattr(kernels, 'grow_' + version)
+            overshoots = getattr(kernels, 'overshoots_' + version)
+            head_on = getattr(kernels, 'head_on_' + version)
+
+            def meetings(origin, dest, owner, length, n):
+                i, j = head_on(np.array(origin, dtype=np.int32),
+                               np.array(dest, dtype=np.int32),
+                               np.array(owner, dtype=np.int32),
+                               np.array(length), maximum, n, first,
+                               is_shared, 3)
+                return list(zip(i.tolist(), j.tolist()))
+
+            length = np.array([0.5, 2.0])
+            grow(length, alive, 0, 0.3)
+            self.assertEqual(length.tolist(), [0.5, 2.0])
+            grow(length, alive, 2, 0.3)
+            self.assertEqual(length.tolist(), [0.8, 2.0])
+            self.assertEqual(overshoots(length, maximum, 0).tolist(), [])
+            self.assertEqual(overshoots(length, maximum, 2).tolist(), [1])
+
+            self.assertEqual(meetings([0, 1], [1, 0], [0, 1], [0.5, 0.5], 0), [])
+            self.assertEqual(meetings([0, 1], [1, 0], [0, 1], [0.5, 0.5], 1), [])
+            self.assertEqual(meetings([0, 2], [1, 1], [0, 2], [0.5, 0.5], 2), [])
+            self.assertEqual(meetings([0, 1], [1, 0], [0, 1], [0.5, 0.4], 2), [])
+            self.assertEqual(meetings([0, 1], [1, 0], [0, 1], [0.5, 0.5], 2),
+                             [(0, 1), (1, 0)])
+
+
+class TestPatterns(TestCase):
+    '''Grids and origins of the patterns.'''
+
+    def test_grids(self):
+        i, j = grid42(4, 3)
+        self.assertEqual(len(set(zip(i.tolist(), j.tolist()))), 12)
+        i, k = grid6(5, 4)
+        self.assertEqual(len(set(zip(i.tolist(), k.tolist()))), 20)
+        self.assertEqual(sorted(set(k.tolist())), [20, 21, 22, 23])
+
+    def test_origins(self):
+        '''Distinct origins on the grid, reproducible from the seed.'''
+        random.seed(2)
+        lattice, i, j = layout42(4, 10, 10, p=0.3)
+        self.assertEqual(len(i), 30)
+        grid = set(zip(*[x.tolist() for x in grid42(10, 10)]))
+        origins = set(zip(i.tolist(), j.tolist()))
+        self.assertEqual(len(origins), 30)
+        self.assertTrue(origins <= grid)
+        self.assertTrue(all(lattice.sites(i, j) >= 0))
+        random.seed(2)
+        self.assertEqual(layout42(4, 10, 10, p=0.3)[1].tolist(), i.tolist())
+
+        neurons = pattern6(6, 6, p=0.5, periodic=True)
+        sites = [x.lattice.site(x.origin) for x in neurons]
+        self.assertEqual(len(set(sites)), 18)
+
+
+class TestExp(TestCase):
+    '''Experiments run in process, with any engine.'''
+
+    class Params(object):
+        N_run = 2
+        T = 30
+        pn = 0.3
+        Local = True
+        Nx = 6
+        Ny = 6
+        SPLIT_PROBABILITY = 0.2
+
+    def test_engines(self):
+        '''Engines give the same runs for one seed, and settings come back
+        after the run.'''
+        results = Exp(4, self.Params, seed=3).run()
+        self.assertEqual(results['fraction'].shape, (2, 31))
+        self.assertEqual(results['first_contact'].shape, (2, 10, 2))
+        self.assertEqual(results['growth'].shape, (2, 31, 5))
+        for engine in ('arrays', 'events'):
+            other = Exp(4, self.Params, seed=3, engine=engine).run()
+            self.assertEqual(other['fraction'].tolist(), results['fraction'].tolist())
+            self.assertEqual(other['growth'][..., [0, 1, 3, 4]].tolist(),
+                             results['growth'][..., [0, 1, 3, 4]].tolist())
+            self.assertTrue(np.allclose(other['growth'], results['growth']))
+        batch = Exp(4, self.Params, seed=3, engine='batch').run()
+        self.assertEqual(batch['largest'].shape, (2, 31))
+        self.assertEqual(settings.SPLIT_PROBABILITY, 0.1)
+        self.assertEqual(ArrayEngine.split_prob, 0.1)
+
+    def test_tiles(self):
+        '''Tile workers grow with the params, whether forked or spawned.'''
+        class Params(self.Params):
+            GROW_SPEED = 2.9
+
+        results = Exp(4, Params, seed=3, engine='tiles', tiles=(2, 1)).run()
+        live, dead, length = results['growth'][0, 0, :3]
+        self.assertAlmostEqual(length, 2.9 * (live + dead))
+        TiledEngine.start_method = 'spawn'
+        try:
+            spawned = Exp(4, Params, seed=3, engine='tiles', tiles=(2, 1)).run()
+        finally:
+            TiledEngine.start_method = None
+        for name in ('fraction', 'growth', 'first_contact'):
+            self.assertEqual(spawned[name].tolist(), results[name].tolist())
+        self.assertEqual(settings.GROW_SPEED, 1.6)
+
+    def test_drawing(self):
+        '''Drawing leaves a seeded run as it is.'''
+        class Params(self.Params):
+            Lx = 200
+            Ly = 200
+
+        directory = tempfile.mkdtemp()
+        try:
+            for engine in ('objects', 'arrays'):
+                results = Exp(4, Params, seed=3, engine=engine).run()
+                drawn = Exp(4, Params, seed=3, engine=engine,
+                            directory=directory).run()
+                for name in ('fraction', 'growth', 'first_contact'):
+                    self.assertEqual(drawn[name].tolist(), results[name].tolist())
+            self.assertEqual(len(os.listdir(directory)), 2 * 31)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_observers(self):
+        '''Observers see every run at their stride, through read-only
+        views, and their time is counted apart.'''
+        class Tips(Observer):
+            stride = 10
+
+            def __init__(self):
+                self.calls = []
+
+            def born(self, view):
+                self.calls.append(('born', view.run, view.t))
+
+            def grown(self, view):
+                self.writeable = view.tips()['length'].flags.writeable
+                self.frontier = len(set(view.frontier_sites()))
+                self.calls.append(('grown', view.run, view.t))
+
+            def finished(self, view):
+                self.calls.append(('finished', view.run, view.t))
+
+        for engine in ('objects', 'events', 'batch'):
+            observer = Tips()
+            exp = Exp(4, self.Params, seed=3, engine=engine, observers=[observer])
+            exp.run()
+            for r in range(2):
+                calls = [x for x in observer.calls if x[1] == r]
+                self.assertEqual(calls, [('born', r, 0), ('grown', r, 10),
+                                         ('grown', r, 20), ('grown', r, 30),
+                                         ('finished', r, 31)])
+            self.assertFalse(observer.writeable)
+            self.assertTrue(observer.frontier > 0)
+            self.assertTrue(exp.seconds[observer] > 0)
+            self.assertTrue(exp.seconds['engine'] > 0)
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            Exp(4, self.Params, engine='lists')
+        with self.assertRaises(ValueError):
+            Exp(4, self.Params, chunked=True, periodic=True)
+        with self.assertRaises(ValueError):
+            Exp(4, self.Params, chunked=True, engine='batch')
+
+
 class TestEqualCoor(TestCase):
 
     def setUp(self):